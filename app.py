@@ -1,11 +1,10 @@
 import streamlit as st
-from scorer.scorer import score_query
-import sqlfluff
+from scorer.scorer import score_query, fix_sql
 
 def get_optimized_query(query: str) -> str:
     """Get the optimized version of a query using sqlfluff"""
     try:
-        return sqlfluff.fix(query, dialect="postgres") or query
+        return fix_sql(query)
     except Exception as e:
         st.error(f"Error optimizing query: {e}")
         return query
@@ -34,6 +33,12 @@ def main():
         score1 = score_query(query1)
         score2 = score_query(query2)
 
+        # Queries stopped by the sandbox (time, memory or row limits) or failing outright
+        for label, score in (("Query 1", score1), ("Query 2", score2)):
+            if "error" in score:
+                st.error(f"{label}: {score['error']}")
+                return
+
         # Display results
         st.header("Results")
         
@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import atexit
+import shutil
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+# Everything the benchmark stores (performance history, lint cache) goes to a
+# throwaway database: set before db.config is imported, so the configured
+# history never sees the benchmark's samples and its thresholds stay intact
+_scratch_dir = tempfile.mkdtemp(prefix="sql-scorer-bench-")
+atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+os.environ["SQL_SCORER_HISTORY_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'history.db')}"
+
+import numpy as np
+import sqlfluff
+import sqlparse
+import sqlalchemy
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from db.config import DB_PATH, ROOT_DIR
+from db.database import benchmark_sql, run_explain, get_table_stats, summarize_samples
+from db.generate_data import parse_scale, skewed_ids
+from scorer.batch import iter_queries, score_queries
+from scorer.query_analysis import QueryAnalysis
+from scorer.scorer import LINT_DIALECT, analyze_sql, analyze_explain_plan, score_query
+from scorer.performance_metrics import (
+    history_session, prepare_history_engine, QuerySample, QueryFingerprintRecord, QueryFingerprintBand,
+    intern_texts, to_epoch, fingerprint_rows, find_similar_groups, find_similar_queries, store_performance_metrics,
+    calculate_performance_score,
+)
+
+# Each corpus query is also benchmarked repeated this many times in a UNION ALL
+CORPUS_UNION_SIZES = (4, 16)
+DEFAULT_HISTORY_SIZES = "1K,10K,100K,1M"
+# Synthetic history rows per query group, and the most groups fingerprinted
+HISTORY_ROWS_PER_GROUP = 100
+SIMILARITY_PROBES = 20
+INSERT_CHUNK = 50_000
+
+HISTORY_TABLES = ["users", "orders", "products", "order_items", "reviews"] + [f"t_{i}" for i in range(20)]
+HISTORY_COLUMNS = ["id", "name", "age", "user_id", "order_date", "total_price", "price",
+                   "quantity", "comment"] + [f"c_{i}" for i in range(30)]
+
+def build_corpus(paths):
+    """
+    Benchmark corpus: every query found in paths, plus larger UNION ALL
+    variants of it. Returns [(name, query)]
+    """
+    corpus = []
+    for source, query in iter_queries(paths):
+        base = query.strip().rstrip(";")
+        name = os.path.splitext(os.path.basename(source))[0].replace("#", "_")
+        corpus.append((name, base))
+        for copies in CORPUS_UNION_SIZES:
+            corpus.append((f"{name}_union{copies}", "\nUNION ALL\n".join([base] * copies)))
+    return corpus
+
+def time_call(function, repeat):
+    """Call function repeat times; returns (timing summary in seconds, last result)"""
+    samples = []
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return summarize_samples(samples), result
+
+def lint_uncached(query):
+    """sqlfluff lint exactly as analyze_sql runs it on a cache miss"""
+    return sqlfluff.lint(sqlparse.format(query, reindent=True), dialect=LINT_DIALECT)
+
+def benchmark_stages(query, repeat=5):
+    """Time each stage of score_query for one query, and score_query as a whole"""
+    stages = {}
+    stages["parse"], analysis = time_call(lambda: QueryAnalysis.from_query(query), repeat)
+    stages["lint"], _ = time_call(lambda: lint_uncached(query), repeat)
+    analyze_sql(query)
+    stages["lint_cached"], lint = time_call(lambda: analyze_sql(query), repeat)
+    analysis = analysis.with_lint(lint["violation_summary"], lint["formatted_query"])
+
+    stages["execute"], benchmark = time_call(
+        lambda: benchmark_sql(query, warmup=0, iterations=1), repeat
+    )
+    if benchmark is None:
+        return {"error": "Query execution failed.", "stages": stages}
+    stages["explain"], _ = time_call(
+        lambda: analyze_explain_plan(run_explain(query), analysis, get_table_stats()), repeat
+    )
+
+    session = history_session()
+    try:
+        stages["similarity"], _ = time_call(lambda: find_similar_groups(analysis, session), repeat)
+    finally:
+        session.close()
+
+    exec_time = benchmark["execution_time"]["median"]
+    cpu_usage = benchmark["cpu_usage"]["median"]
+    stages["store"], _ = time_call(lambda: store_performance_metrics(exec_time, cpu_usage, analysis), repeat)
+    stages["thresholds"], _ = time_call(
+        lambda: calculate_performance_score(exec_time, cpu_usage, analysis), repeat
+    )
+    stages["total"], _ = time_call(lambda: score_query(query, warmup=0, iterations=1), repeat)
+    return {"stages": stages}
+
+def history_query(rng):
+    """A random query shape for a synthetic history group"""
+    table = rng.choice(HISTORY_TABLES)
+    columns = ", ".join(rng.sample(HISTORY_COLUMNS, rng.randint(1, 4)))
+    query = f"SELECT {columns} FROM {table} a"
+    if rng.random() < 0.5:
+        joined = rng.choice(HISTORY_TABLES)
+        query += f" JOIN {joined} b ON a.{rng.choice(HISTORY_COLUMNS)} = b.{rng.choice(HISTORY_COLUMNS)}"
+    for index in range(rng.randint(0, 3)):
+        keyword = "WHERE" if index == 0 else rng.choice(["AND", "OR"])
+        query += f" {keyword} a.{rng.choice(HISTORY_COLUMNS)} {rng.choice(['=', '>', '<'])} {rng.randint(0, 100)}"
+    if rng.random() < 0.3:
+        query += f" ORDER BY {rng.choice(HISTORY_COLUMNS)}"
+    return query
+
+class SyntheticHistory:
+    """A throwaway performance history database that can be grown in steps"""
+
+    def __init__(self, path, max_groups, seed=42):
+        self.engine = prepare_history_engine(create_engine(f"sqlite:///{path}"))
+        self.Session = sessionmaker(bind=self.engine)
+        self.max_groups = max_groups
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        self.groups = []  # (group, query)
+        self.text_ids = {}  # (group, query) -> QueryText.id
+        self.seen = set()
+        self.rows = 0
+
+    def _add_groups(self, count):
+        records, bands = [], []
+        attempts = 0
+        known = len(self.groups)
+        while len(self.groups) < count and attempts < count * 20:
+            attempts += 1
+            analysis = QueryAnalysis.from_query(history_query(self.rng))
+            if analysis.group in self.seen:
+                continue
+            self.seen.add(analysis.group)
+            self.groups.append((analysis.group, analysis.query))
+            record, record_bands = fingerprint_rows(
+                analysis.group, analysis.normalized, list(analysis.structure), analysis.signature, analysis.vector
+            )
+            records.append(record)
+            bands.extend(record_bands)
+        if records:
+            with self.engine.begin() as conn:
+                conn.execute(insert(QueryFingerprintRecord.__table__), records)
+                conn.execute(insert(QueryFingerprintBand.__table__), bands)
+                self.text_ids.update(intern_texts(conn, self.groups[known:]))
+
+    def grow(self, rows):
+        """Add samples until the history holds rows samples"""
+        self._add_groups(min(self.max_groups, max(10, rows // HISTORY_ROWS_PER_GROUP)))
+        now = datetime.now(timezone.utc)
+        while self.rows < rows:
+            size = min(INSERT_CHUNK, rows - self.rows)
+            # A few groups run far more often than the rest
+            picks = skewed_ids(self.np_rng, len(self.groups), size) - 1
+            times = self.np_rng.lognormal(-5, 1.5, size)
+            cpu = times * self.np_rng.uniform(0.05, 1.0, size)
+            sample_rows = []
+            for offset, (pick, execution_time, cpu_usage) in enumerate(zip(picks.tolist(), times.tolist(), cpu.tolist())):
+                sample_rows.append({
+                    "text_id": self.text_ids[self.groups[pick]],
+                    "timestamp": to_epoch(now - timedelta(seconds=self.rows + offset)),
+                    "execution_time": execution_time,
+                    "cpu_usage": cpu_usage,
+                })
+            with self.engine.begin() as conn:
+                conn.execute(insert(QuerySample.__table__), sample_rows)
+            self.rows += size
+
+    def dispose(self):
+        self.engine.dispose()
+
+def benchmark_similarity(history_sizes, max_groups=10_000, repeat=5, seed=42):
+    """Time find_similar_groups/find_similar_queries as the history grows"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sql-scorer-bench-") as directory:
+        history = SyntheticHistory(os.path.join(directory, "history.db"), max_groups, seed)
+        try:
+            for rows in sorted(history_sizes):
+                start = time.perf_counter()
+                history.grow(rows)
+                load_seconds = time.perf_counter() - start
+
+                probes = [
+                    QueryAnalysis.from_query(query)
+                    for _, query in random.Random(seed).sample(history.groups, min(SIMILARITY_PROBES, len(history.groups)))
+                ]
+                session = history.Session()
+                try:
+                    group_samples, query_samples, matches = [], [], []
+                    for probe in probes:
+                        summary, groups = time_call(lambda: find_similar_groups(probe, session), repeat)
+                        group_samples.append(summary["median"])
+                        matches.append(len(groups))
+                        summary, _ = time_call(lambda: find_similar_queries(probe, session), repeat)
+                        query_samples.append(summary["median"])
+                finally:
+                    session.close()
+
+                results.append({
+                    "history_rows": history.rows,
+                    "groups": len(history.groups),
+                    "load_seconds": load_seconds,
+                    "similar_groups_mean": float(np.mean(matches)) if matches else 0.0,
+                    "find_similar_groups": summarize_samples(group_samples),
+                    "find_similar_queries": summarize_samples(query_samples),
+                })
+                print(f"similarity: {history.rows} rows, {len(history.groups)} groups", file=sys.stderr)
+        finally:
+            history.dispose()
+    return results
+
+def benchmark_throughput(corpus, rounds=3, workers=None):
+    """End-to-end batch scoring throughput over the corpus"""
+    items = [(f"{name}#{round_index}", query) for round_index in range(rounds) for name, query in corpus]
+    start = time.perf_counter()
+    results = list(score_queries(items, workers=workers, warmup=0, iterations=1))
+    elapsed = time.perf_counter() - start
+    return {
+        "queries": len(items),
+        "errors": sum(1 for result in results if "error" in result),
+        "seconds": elapsed,
+        "queries_per_second": len(items) / elapsed if elapsed > 0 else None,
+        "workers": workers or os.cpu_count(),
+    }
+
+def environment():
+    """Versions and machine details recorded with the results"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sqlfluff": sqlfluff.__version__,
+        "sqlparse": sqlparse.__version__,
+        "sqlalchemy": sqlalchemy.__version__,
+        "numpy": np.__version__,
+        "database": DB_PATH,
+    }
+
+def flatten_medians(results):
+    """{metric name: (value, higher is better)} for comparing two result files"""
+    metrics = {}
+    for name, entry in results.get("stages", {}).items():
+        for stage, summary in entry.get("stages", {}).items():
+            metrics[f"stages.{name}.{stage}"] = (summary["median"], False)
+    for entry in results.get("similarity", []):
+        for operation in ("find_similar_groups", "find_similar_queries"):
+            metrics[f"similarity.{entry['history_rows']}.{operation}"] = (entry[operation]["median"], False)
+    throughput = results.get("throughput")
+    if throughput and throughput.get("queries_per_second"):
+        metrics["throughput.queries_per_second"] = (throughput["queries_per_second"], True)
+    return metrics
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    Compare two result files metric by metric
+    Returns (report lines, regressions): a regression is a metric more than
+    tolerance slower (or lower, for throughput) than the baseline
+    """
+    old, new = flatten_medians(baseline), flatten_medians(current)
+    lines = [f"{'Metric':<50} {'Baseline':>12} {'Current':>12} {'Change':>8}"]
+    regressions = []
+    for metric in sorted(old.keys() & new.keys()):
+        (before, higher_is_better), (after, _) = old[metric], new[metric]
+        if before <= 0:
+            continue
+        change = after / before - 1
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(metric)
+            flag = "  REGRESSION"
+        lines.append(f"{metric:<50} {before:>12.6f} {after:>12.6f} {change:>+8.1%}{flag}")
+    return lines, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQL-Scorer pipeline")
+    parser.add_argument("--queries", nargs="+", default=[os.path.join(ROOT_DIR, "queries")],
+                        help="Query files or directories the corpus is built from")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON results file")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per measurement")
+    parser.add_argument("--history-sizes", default=DEFAULT_HISTORY_SIZES,
+                        help="Comma separated history sizes for the similarity benchmark")
+    parser.add_argument("--max-groups", type=int, default=10_000, help="Most query groups in the synthetic history")
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the corpus for the throughput benchmark")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["stages", "similarity", "throughput"])
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.queries)
+    results = {
+        "environment": environment(),
+        "corpus": [
+            {"name": name, "characters": len(query), "tokens": len(list(sqlparse.parse(query)[0].flatten()))}
+            for name, query in corpus
+        ],
+    }
+
+    if "stages" not in args.skip:
+        results["stages"] = {}
+        for name, query in corpus:
+            print(f"stages: {name}", file=sys.stderr)
+            results["stages"][name] = benchmark_stages(query, args.repeat)
+    if "similarity" not in args.skip:
+        sizes = [parse_scale(size) for size in args.history_sizes.split(",")]
+        results["similarity"] = benchmark_similarity(sizes, args.max_groups, args.repeat)
+    if "throughput" not in args.skip:
+        print("throughput", file=sys.stderr)
+        results["throughput"] = benchmark_throughput(corpus, args.rounds, args.workers)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare_results(baseline, results, args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import json
+import psutil
+from sqlalchemy import text, inspect, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from db.config import DB_URL
+
+def process_io_counters():
+    """Cumulative I/O counters of this process, or None where the OS has none"""
+    try:
+        counters = psutil.Process().io_counters()
+    except (AttributeError, psutil.Error):
+        return None
+    return counters._asdict()
+
+def io_delta(before, after):
+    """Per-counter difference between two io_counters() snapshots"""
+    if before is None or after is None:
+        return None
+    return {name: after[name] - before[name] for name in after if name in before}
+
+class Backend:
+    """
+    What differs between database engines: the sqlfluff dialect, how a
+    plan is obtained and which I/O counters are reported with the timings
+    """
+    name = "generic"
+    lint_dialect = "ansi"
+    # Runs inside this process, so its memory use shows in our RSS
+    embedded = False
+
+    def configure_engine(self, engine):
+        """Adjust a new engine of this backend; returns it"""
+        return engine
+
+    def explain(self, conn, query, analyze=False):
+        """Plan of query in the backend's own format (see scorer.plan_analyzer)"""
+        return []
+
+    def table_stats(self, conn):
+        """Row estimates: (table_rows, index_rows_per_key)"""
+        return {}, {}
+
+    def table_definitions(self, conn):
+        """
+        Schema of every table and view as comparable text: table -> its
+        definition and those of its indexes (and triggers), in a stable order
+        """
+        inspector = inspect(conn)
+        definitions = {}
+        for table in inspector.get_table_names() + inspector.get_view_names():
+            columns = [(c["name"], str(c["type"]), c.get("nullable")) for c in inspector.get_columns(table)]
+            indexes = sorted((i["name"] or "", i["column_names"], i.get("unique")) for i in inspector.get_indexes(table))
+            definitions[table] = json.dumps([columns, indexes], default=str)
+        return definitions
+
+    def io_counters(self):
+        """Counters sampled around every measured run, or None"""
+        return None
+
+    def plan_io(self, plan):
+        """I/O counters reported by the plan itself (EXPLAIN ANALYZE), or None"""
+        return None
+
+    def pages_read(self, conn, io):
+        """Database pages read according to io (io_counters or plan_io figures), or None"""
+        return None
+
+    def apply_limits(self, conn, limits):
+        """Set engine-side limits (db.sandbox.Limits) before a run"""
+
+    def interrupt(self, dbapi_connection):
+        """Abort the statement running on a DBAPI connection; called from another thread"""
+        dbapi_connection.interrupt()
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+    lint_dialect = "sqlite"
+    embedded = True
+
+    def configure_engine(self, engine):
+        """
+        Let SQLAlchemy's begin emit BEGIN itself: pysqlite's own transaction
+        handling commits before DDL, so a rolled-back run would still create
+        or drop tables
+        """
+        @event.listens_for(engine, "connect")
+        def _connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def _begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        return engine
+
+    def explain(self, conn, query, analyze=False):
+        """EXPLAIN QUERY PLAN rows: (id, parent, notused, detail)"""
+        return [tuple(row) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"))]
+
+    def table_stats(self, conn):
+        """
+        Uses sqlite_stat1 (written by ANALYZE) where available and falls back
+        to the rowid upper bound, which costs one index probe per table.
+        """
+        table_rows = {}
+        index_rows_per_key = {}
+        tables = [row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ))]
+        has_stat1 = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        )).first() is not None
+        if has_stat1:
+            for table, index, stat in conn.execute(text("SELECT tbl, idx, stat FROM sqlite_stat1")):
+                numbers = [int(n) for n in (stat or "").split() if n.isdigit()]
+                if not numbers:
+                    continue
+                table_rows.setdefault(table, numbers[0])
+                if index is not None and len(numbers) > 1:
+                    index_rows_per_key[index] = numbers[1]
+        for table in tables:
+            if table not in table_rows:
+                try:
+                    max_rowid = conn.execute(text(f'SELECT MAX(rowid) FROM "{table}"')).scalar()
+                except SQLAlchemyError:
+                    # WITHOUT ROWID tables
+                    continue
+                table_rows[table] = max_rowid or 0
+        return table_rows, index_rows_per_key
+
+    def table_definitions(self, conn):
+        """The CREATE statements sqlite_master keeps, read in one query"""
+        definitions = {}
+        for table, sql in conn.execute(text(
+            "SELECT tbl_name, sql FROM sqlite_master "
+            "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY tbl_name, type, name"
+        )):
+            definitions[table] = definitions.get(table, "") + sql + ";\n"
+        return definitions
+
+    def io_counters(self):
+        # SQLite runs in this process, so its file reads and writes are ours
+        return process_io_counters()
+
+    def pages_read(self, conn, io):
+        # Every page SQLite misses in its own cache is one read() of the file
+        if not io or "read_chars" not in io:
+            return None
+        page_size = conn.execute(text("PRAGMA page_size")).scalar()
+        return io["read_chars"] // page_size
+
+class PostgresBackend(Backend):
+    name = "postgresql"
+    lint_dialect = "postgres"
+
+    def explain(self, conn, query, analyze=False):
+        """
+        The JSON plan ({"Plan": ..., ...}); with analyze the query is run
+        (and rolled back) to get actual rows, loops and buffer counters
+        """
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        try:
+            plan = conn.execute(text(f"EXPLAIN ({options}) {query}")).scalar()
+        finally:
+            conn.rollback()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]
+
+    def table_stats(self, conn):
+        """Planner row estimates from pg_class (reltuples is -1 before the first ANALYZE)"""
+        rows = conn.execute(text(
+            "SELECT c.relname, c.reltuples FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind IN ('r', 'p', 'm') "
+            "AND n.nspname NOT IN ('pg_catalog', 'information_schema')"
+        ))
+        return {name: int(tuples) for name, tuples in rows if tuples >= 0}, {}
+
+    def table_definitions(self, conn):
+        """Columns and index definitions from the catalog, in two queries"""
+        definitions = {}
+        for table, column, data_type, nullable in conn.execute(text(
+            "SELECT table_name, column_name, data_type, is_nullable FROM information_schema.columns "
+            "WHERE table_schema NOT IN ('pg_catalog', 'information_schema') "
+            "ORDER BY table_schema, table_name, ordinal_position"
+        )):
+            definitions[table] = definitions.get(table, "") + f"{column} {data_type} {nullable};\n"
+        for table, index in conn.execute(text(
+            "SELECT tablename, indexdef FROM pg_indexes "
+            "WHERE schemaname NOT IN ('pg_catalog', 'information_schema') ORDER BY tablename, indexname"
+        )):
+            definitions[table] = definitions.get(table, "") + index + ";\n"
+        return definitions
+
+    def plan_io(self, plan):
+        """Buffer counters of the whole statement (the root node includes its children)"""
+        root = (plan or {}).get("Plan", {})
+        if "Shared Hit Blocks" not in root:
+            return None
+        counters = {
+            "shared_hit_blocks": "Shared Hit Blocks",
+            "shared_read_blocks": "Shared Read Blocks",
+            "shared_dirtied_blocks": "Shared Dirtied Blocks",
+            "shared_written_blocks": "Shared Written Blocks",
+            "temp_read_blocks": "Temp Read Blocks",
+            "temp_written_blocks": "Temp Written Blocks",
+        }
+        return {name: root.get(key, 0) for name, key in counters.items()}
+
+    def pages_read(self, conn, io):
+        """Shared buffers read (hit or from disk), from plan_io"""
+        if not io or "shared_hit_blocks" not in io:
+            return None
+        return io["shared_hit_blocks"] + io["shared_read_blocks"]
+
+    def apply_limits(self, conn, limits):
+        if limits.timeout:
+            # Server-side backstop should the client die; the sandbox cancels first
+            conn.execute(text(f"SET LOCAL statement_timeout = {int((limits.timeout + 1) * 1000)}"))
+
+    def interrupt(self, dbapi_connection):
+        dbapi_connection.cancel()
+
+class DuckDBBackend(Backend):
+    name = "duckdb"
+    lint_dialect = "duckdb"
+    embedded = True
+
+    def explain(self, conn, query, analyze=False):
+        """The JSON physical plan: a list of operator trees"""
+        for key, value in conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")):
+            if key == "physical_plan":
+                return json.loads(value)
+        return []
+
+    def table_stats(self, conn):
+        rows = conn.execute(text("SELECT table_name, estimated_size FROM duckdb_tables()"))
+        return {name: int(size or 0) for name, size in rows}, {}
+
+    def table_definitions(self, conn):
+        """CREATE statements of tables, views and indexes from DuckDB's catalog functions"""
+        definitions = {}
+        for table, sql in conn.execute(text(
+            "SELECT table_name, sql FROM duckdb_tables() "
+            "UNION ALL SELECT view_name, sql FROM duckdb_views() WHERE NOT internal "
+            "UNION ALL SELECT table_name, sql FROM duckdb_indexes() ORDER BY 1, 2"
+        )):
+            definitions[table] = definitions.get(table, "") + (sql or "") + "\n"
+        return definitions
+
+    def io_counters(self):
+        # Embedded like SQLite
+        return process_io_counters()
+
+    def apply_limits(self, conn, limits):
+        if limits.memory_mb:
+            # DuckDB spills or fails cleanly at its own limit, before the sandbox has to step in
+            conn.execute(text(f"SET memory_limit = '{int(limits.memory_mb)}MB'"))
+
+BACKENDS = {backend.name: backend for backend in (SQLiteBackend(), PostgresBackend(), DuckDBBackend())}
+
+def get_backend(db_url=None) -> Backend:
+    """Backend of a database URL (default: the configured database)"""
+    name = make_url(db_url or DB_URL).get_backend_name()
+    return BACKENDS.get(name, Backend())
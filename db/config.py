@@ -3,10 +3,53 @@ import os
 # Get the project root directory
 ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
 
-# Ensure data directory exists
+# Data directory, created by whatever writes to it first
 DATA_DIR = os.path.join(ROOT_DIR, 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
 
-# Database configuration
-DB_PATH = os.path.join(DATA_DIR, 'test.db')
-DB_URL = f"sqlite:///{DB_PATH}"
+# Database configuration (DB_PATH selects another database, e.g. a generated dataset)
+DB_PATH = os.environ.get('DB_PATH', os.path.join(DATA_DIR, 'test.db'))
+# DB_URL selects another backend, e.g. postgresql://user@host/db or duckdb:///data/test.duckdb
+DB_URL = os.environ.get('DB_URL', f"sqlite:///{DB_PATH}")
+
+# Performance history and lint cache: next to a SQLite target, in a local file otherwise
+HISTORY_URL = os.environ.get(
+    'SQL_SCORER_HISTORY_URL',
+    DB_URL if DB_URL.startswith('sqlite') else f"sqlite:///{os.path.join(DATA_DIR, 'history.db')}"
+)
+
+# History retention in days (0 keeps forever): raw samples are dropped first and
+# live on in the hourly and daily rollups (per-group quantile sketches)
+HISTORY_RAW_RETENTION_DAYS = float(os.environ.get('SQL_SCORER_RAW_RETENTION_DAYS', 7))
+HISTORY_HOURLY_RETENTION_DAYS = float(os.environ.get('SQL_SCORER_HOURLY_RETENTION_DAYS', 90))
+HISTORY_DAILY_RETENTION_DAYS = float(os.environ.get('SQL_SCORER_DAILY_RETENTION_DAYS', 730))
+
+# Benchmark configuration: warmup runs are discarded, measured runs are summarized
+BENCHMARK_WARMUP = int(os.environ.get('SQL_SCORER_WARMUP', 1))
+BENCHMARK_ITERATIONS = int(os.environ.get('SQL_SCORER_ITERATIONS', 5))
+
+# Distinct statements whose normalization the log importer keeps in memory (0 disables)
+NORMALIZE_CACHE_SIZE = int(os.environ.get('SQL_SCORER_NORMALIZE_CACHE', 4096))
+
+# Execution sandbox, per measured run: wall-clock limit in seconds, growth of
+# this process's memory in MB (embedded engines) and rows returned; 0 disables one
+SANDBOX_TIMEOUT = float(os.environ.get('SQL_SCORER_TIMEOUT', 30))
+SANDBOX_MEMORY_MB = float(os.environ.get('SQL_SCORER_MEMORY_MB', 1024))
+SANDBOX_MAX_ROWS = int(os.environ.get('SQL_SCORER_MAX_ROWS', 1_000_000))
+
+# Incremental batch runs (--incremental, --watch): per-file content hashes, the
+# schema version of the tables each query uses and the last results
+SCORE_MANIFEST = os.environ.get('SQL_SCORER_MANIFEST', os.path.join(DATA_DIR, 'score-manifest.json'))
+
+# Databases the scoring service may run queries against, by name
+# (more from SQL_SCORER_TARGETS, e.g. "pg=postgresql://localhost/shop,duck=duckdb:///shop.duckdb")
+TARGETS = {'default': DB_URL}
+for target in filter(None, os.environ.get('SQL_SCORER_TARGETS', '').split(',')):
+    name, _, url = target.partition('=')
+    TARGETS[name.strip()] = url.strip()
+
+# Fraction of score_query calls run under cProfile, and where the stats files go
+PROFILE_SAMPLE_RATE = float(os.environ.get('SQL_SCORER_PROFILE_RATE', 0))
+PROFILE_DIR = os.environ.get('SQL_SCORER_PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+
+# Unix socket of the CLI daemon (python main.py --daemon)
+DAEMON_SOCKET = os.environ.get('SQL_SCORER_SOCKET', os.path.join(DATA_DIR, 'sql-scorer.sock'))
@@ -1,37 +1,243 @@
+import os
+import sys
 import time
-import psutil
+import math
+import sqlite3
+import threading
+import numpy as np
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import SQLAlchemyError
-from db.config import DB_URL
+from db.config import DB_URL, BENCHMARK_WARMUP, BENCHMARK_ITERATIONS
+from db.backends import get_backend, io_delta
+from db.sandbox import Sandbox, LimitExceeded
+
+def _create_engine(db_url, **options):
+    """Engine of a target database, set up by its backend"""
+    return get_backend(db_url).configure_engine(create_engine(db_url, **options))
 
 # Connect to SQLite
-engine = create_engine(DB_URL)
+engine = _create_engine(DB_URL)
+
+# Pooled engines per target database, created on first use
+_engines = {DB_URL: engine}
+_engines_lock = threading.Lock()
+
+def get_engine(db_url=None):
+    """Return the shared, pooled engine for db_url (default: the configured database)"""
+    if db_url is None:
+        return engine
+    with _engines_lock:
+        if db_url not in _engines:
+            _engines[db_url] = _create_engine(db_url, pool_pre_ping=True)
+        return _engines[db_url]
 
-def execute_sql(query):
-    """Executes a SQL query and measures performance"""
+def dispose_engine(db_url):
+    """Close the pooled connections of db_url and forget its engine"""
+    with _engines_lock:
+        target = _engines.pop(db_url, None) if db_url != DB_URL else None
+    if target is not None:
+        target.dispose()
+
+def snapshot_database(dest_path, source_path=None):
+    """
+    Copy a SQLite database (default: the configured one) with the online
+    backup API, so queries run on the copy cannot affect the source.
+    Returns the URL of the copy. Raises ValueError when the configured
+    database is not a SQLite file and FileNotFoundError when the source
+    does not exist
+    """
+    if source_path is None:
+        url = make_url(DB_URL)
+        if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+            raise ValueError(f"Snapshots need a SQLite database file, not {url.render_as_string()}")
+        source_path = url.database
+    if not os.path.isfile(source_path):
+        # sqlite3.connect would create an empty database
+        raise FileNotFoundError(f"No database at {source_path}")
+    source = sqlite3.connect(source_path)
+    dest = sqlite3.connect(dest_path)
     try:
-        with engine.connect() as conn:
-            start_time = time.time()
-            process = psutil.Process()
-            cpu_before = process.cpu_percent()
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+    return f"sqlite:///{dest_path}"
+
+def _timed_execute(conn, query, sandbox=None):
+    """
+    Executes a query once on conn and measures it
+    sandbox: the Sandbox guarding the run, which also limits the rows returned
+    Returns (wall seconds, CPU seconds, row count); CPU time is this
+    process's, so it includes the engine's work only when it is embedded
+    """
+    max_rows = sandbox.limits.max_rows if sandbox is not None else 0
+    start_wall = time.perf_counter_ns()
+    start_cpu = time.process_time_ns()
+
+    result = conn.execute(text(query))
+    if result.returns_rows:
+        # Consume the rows so the query is actually evaluated, not just started
+        row_count = 0
+        for _ in result:
+            row_count += 1
+            if max_rows and row_count > max_rows:
+                sandbox.check_rows(row_count)
+    else:
+        row_count = result.rowcount
 
-            result = conn.execute(text(query))
+    wall_ns = time.perf_counter_ns() - start_wall
+    cpu_ns = time.process_time_ns() - start_cpu
+    return wall_ns / 1e9, cpu_ns / 1e9, row_count
+
+def execute_sql(query, db_url=None, limits=None, cancel=None):
+    """Executes a SQL query in the sandbox (see db.sandbox) and measures performance"""
+    try:
+        with get_engine(db_url).connect() as conn:
+            with Sandbox(conn, get_backend(db_url), limits, cancel) as sandbox:
+                execution_time, cpu_usage, row_count = _timed_execute(conn, query, sandbox)
             conn.commit()
+            return execution_time, cpu_usage, row_count
+    except (SQLAlchemyError, LimitExceeded) as e:
+        print(f"SQL execution error {e}", file=sys.stderr)
+        return None, None, None
+
+def reject_outliers(samples, cutoff=3.5):
+    """
+    Drop samples whose modified z-score (based on the median absolute
+    deviation) exceeds cutoff. Returns (kept, rejected_count)
+    """
+    values = np.asarray(samples, dtype=float)
+    if len(values) < 3:
+        return values, 0
+
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return values, 0
+
+    modified_z = 0.6745 * (values - median) / mad
+    kept = values[np.abs(modified_z) <= cutoff]
+    return kept, len(values) - len(kept)
 
-            cpu_after = process.cpu_percent()
-            execution_time = time.time() - start_time
-            return execution_time, cpu_after - cpu_before, result.rowcount
+def summarize_samples(samples, confidence_z=1.96):
+    """
+    Summarize measured samples: median, p95, mean, stdev and a
+    distribution-free confidence interval for the median
+    """
+    values = np.sort(np.asarray(samples, dtype=float))
+    n = len(values)
+
+    # Order-statistic ranks bounding the median (normal approximation to the binomial)
+    half_width = confidence_z * math.sqrt(n) / 2
+    lower = max(0, math.floor(n / 2 - half_width))
+    upper = min(n - 1, math.ceil(n / 2 + half_width) - 1)
+
+    return {
+        "median": float(np.median(values)),
+        "p95": float(np.percentile(values, 95)),
+        "mean": float(np.mean(values)),
+        "stdev": float(np.std(values, ddof=1)) if n > 1 else 0.0,
+        "ci_low": float(values[lower]),
+        "ci_high": float(values[upper]),
+        "samples": n,
+    }
+
+def benchmark_sql(query, warmup=None, iterations=None, outlier_cutoff=3.5, db_url=None,
+                  limits=None, cancel=None):
+    """
+    Runs a query repeatedly and returns timing statistics
+    Every run happens in its own transaction that is rolled back, DDL
+    included (see SQLiteBackend.configure_engine), so DML and DDL are never
+    committed and every run starts from the same state. Warmup runs are
+    discarded and outliers are rejected before summarizing.
+    Each run is guarded by a Sandbox with limits (db.sandbox.Limits) and
+    cancel (threading.Event); a stopped run raises LimitExceeded.
+    Returns a dict with execution_time and cpu_usage (CPU seconds) summaries, the median
+    per-run I/O counters of embedded backends and the resources used
+    (peak RSS, CPU seconds, pages read), or None on error
+    """
+    warmup = BENCHMARK_WARMUP if warmup is None else warmup
+    iterations = BENCHMARK_ITERATIONS if iterations is None else iterations
+    backend = get_backend(db_url)
+
+    wall_samples = []
+    cpu_samples = []
+    io_samples = []
+    run_resources = []
+    row_count = None
+    try:
+        with get_engine(db_url).connect() as conn:
+            for run in range(warmup + max(1, iterations)):
+                with Sandbox(conn, backend, limits, cancel) as sandbox:
+                    io_before = backend.io_counters()
+                    execution_time, cpu_usage, row_count = _timed_execute(conn, query, sandbox)
+                    io = io_delta(io_before, backend.io_counters())
+                conn.rollback()
+                if run >= warmup:
+                    wall_samples.append(execution_time)
+                    cpu_samples.append(cpu_usage)
+                    if io is not None:
+                        io_samples.append(io)
+                    run_resources.append({**sandbox.resources(), "pages_read": backend.pages_read(conn, io)})
     except SQLAlchemyError as e:
-        print(f"SQL execution error {e}")
-        return None, None, None
-    
-def run_explain(query):
-    """Runs EXPLAIN QUERY PLAN and returns insights"""
+        print(f"SQL execution error {e}", file=sys.stderr)
+        return None
+
+    kept_wall, rejected = reject_outliers(wall_samples, outlier_cutoff)
+    return {
+        "execution_time": summarize_samples(kept_wall),
+        "cpu_usage": summarize_samples(cpu_samples),
+        "rows_affected": row_count,
+        "warmup": warmup,
+        "iterations": len(wall_samples),
+        "rejected_outliers": rejected,
+        "io": {
+            name: float(np.median([sample[name] for sample in io_samples]))
+            for name in io_samples[0]
+        } if io_samples else None,
+        "resources": summarize_resources(run_resources),
+    }
+
+def summarize_resources(run_resources):
+    """Peak RSS over the runs and the median CPU seconds and pages read per run"""
+    pages = [r["pages_read"] for r in run_resources if r["pages_read"] is not None]
+    return {
+        "peak_rss_bytes": max(r["peak_rss_bytes"] for r in run_resources),
+        "memory_growth_bytes": max(r["memory_growth_bytes"] for r in run_resources),
+        "cpu_seconds": float(np.median([r["cpu_seconds"] for r in run_resources])),
+        "pages_read": float(np.median(pages)) if pages else None,
+    }
+
+def get_table_stats(db_url=None):
+    """
+    Row estimates for the tables and indexes of a database (see the
+    backend's table_stats). Returns (table_rows, index_rows_per_key)
+    """
+    try:
+        with get_engine(db_url).connect() as conn:
+            return get_backend(db_url).table_stats(conn)
+    except SQLAlchemyError as e:
+        print(f"Failed to read table statistics: {e}", file=sys.stderr)
+        return {}, {}
+
+def run_explain(query, db_url=None, raise_errors=False, analyze=False, limits=None, cancel=None):
+    """
+    Runs EXPLAIN and returns the plan in the backend's format
+    analyze: also execute the query where the backend supports it
+    (PostgreSQL's EXPLAIN ANALYZE, rolled back) for actual row counts,
+    in the sandbox with limits and cancel
+    Errors are printed and give an empty plan unless raise_errors is set
+    """
+    backend = get_backend(db_url)
     try:
-        with engine.connect() as conn:
-            explain_result = conn.execute(text(f"EXPLAIN QUERY PLAN {query}"))
-            rows = explain_result.fetchall()
-            return rows
+        with get_engine(db_url).connect() as conn:
+            if not analyze:
+                return backend.explain(conn, query)
+            with Sandbox(conn, backend, limits, cancel):
+                return backend.explain(conn, query, analyze)
     except Exception as e:
-        print(f"Failed to run EXPLAIN: {e}")
-        return []
\ No newline at end of file
+        if raise_errors:
+            raise
+        print(f"Failed to run EXPLAIN: {e}", file=sys.stderr)
+        return []
@@ -0,0 +1,172 @@
+import os
+import re
+import sqlite3
+import argparse
+import numpy as np
+from db.config import DATA_DIR
+from db.setup_db import SCHEMA
+
+# Generated datasets are cached here, one file per scale factor and seed
+GENERATED_DIR = os.path.join(DATA_DIR, 'generated')
+
+# Share of the total row count given to each table
+TABLE_SHARES = {
+    'users': 0.10,
+    'products': 0.01,
+    'orders': 0.30,
+    'order_items': 0.50,
+    'reviews': 0.09,
+}
+
+# Rows generated and inserted per executemany call
+CHUNK_SIZE = 100_000
+
+# Secondary indexes on the foreign key and filter columns, built after loading
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_orders_user_id ON orders (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_order_date ON orders (order_date)",
+    "CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)",
+    "CREATE INDEX IF NOT EXISTS ix_order_items_product_id ON order_items (product_id)",
+    "CREATE INDEX IF NOT EXISTS ix_reviews_user_id ON reviews (user_id)",
+]
+
+FIRST_NAMES = np.array([
+    'Alice', 'Bob', 'Charlie', 'Diana', 'Ethan', 'Fatma', 'Gabriel', 'Hana',
+    'Ivan', 'Julia', 'Kemal', 'Lena', 'Mehmet', 'Nora', 'Omar', 'Priya',
+])
+PRODUCT_WORDS = np.array([
+    'Widget', 'Gadget', 'Gizmo', 'Doohickey', 'Sprocket', 'Flange', 'Bracket', 'Valve',
+])
+COMMENTS = np.array([
+    'Great product!', 'Works as expected.', 'Arrived late.', 'Would buy again.',
+    'Not worth the price.', 'Excellent quality.', 'Broke after a week.',
+])
+
+def parse_scale(value) -> int:
+    """Parse a row count such as 1000, 10K, 2.5M or 100M"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kKmM]?)\s*", str(value))
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid scale factor: {value}")
+    multiplier = {'': 1, 'k': 1_000, 'm': 1_000_000}[match.group(2).lower()]
+    return int(float(match.group(1)) * multiplier)
+
+def skewed_ids(rng, high, size, skew=2.5):
+    """
+    Ids in 1..high where low ids are much more frequent (power-law skew),
+    like a few customers placing most orders or a few best-selling products
+    """
+    return 1 + np.minimum((high * rng.random(size) ** skew).astype(np.int64), high - 1)
+
+def table_sizes(total_rows):
+    return {table: max(1, int(total_rows * share)) for table, share in TABLE_SHARES.items()}
+
+def _insert(conn, table, columns, rows):
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+def _chunks(count):
+    for start in range(0, count, CHUNK_SIZE):
+        yield start, min(CHUNK_SIZE, count - start)
+
+def _load(conn, sizes, rng):
+    """Generate and insert all tables, respecting foreign keys"""
+    for start, size in _chunks(sizes['users']):
+        names = rng.choice(FIRST_NAMES, size)
+        ages = np.clip(rng.normal(38, 13, size), 18, 90).astype(int)
+        ids = np.arange(start + 1, start + size + 1)
+        _insert(conn, 'users', ('id', 'name', 'age'),
+                zip(ids.tolist(), [f"{n} {i}" for n, i in zip(names, ids)], ages.tolist()))
+
+    for start, size in _chunks(sizes['products']):
+        ids = np.arange(start + 1, start + size + 1)
+        words = rng.choice(PRODUCT_WORDS, size)
+        prices = np.round(rng.lognormal(3.0, 1.0, size), 2)
+        _insert(conn, 'products', ('id', 'name', 'price'),
+                zip(ids.tolist(), [f"{w} {i}" for w, i in zip(words, ids)], prices.tolist()))
+
+    for start, size in _chunks(sizes['orders']):
+        ids = np.arange(start + 1, start + size + 1)
+        user_ids = skewed_ids(rng, sizes['users'], size)
+        # Order volume grows over the four years covered
+        days = (np.sqrt(rng.random(size)) * 1460).astype(int)
+        dates = (np.datetime64('2021-01-01') + days).astype(str)
+        totals = np.round(rng.lognormal(4.0, 0.8, size), 2)
+        _insert(conn, 'orders', ('id', 'user_id', 'order_date', 'total_price'),
+                zip(ids.tolist(), user_ids.tolist(), dates.tolist(), totals.tolist()))
+
+    for start, size in _chunks(sizes['order_items']):
+        ids = np.arange(start + 1, start + size + 1)
+        order_ids = rng.integers(1, sizes['orders'] + 1, size)
+        product_ids = skewed_ids(rng, sizes['products'], size)
+        quantities = rng.geometric(0.5, size)
+        _insert(conn, 'order_items', ('id', 'order_id', 'product_id', 'quantity'),
+                zip(ids.tolist(), order_ids.tolist(), product_ids.tolist(), quantities.tolist()))
+
+    for start, size in _chunks(sizes['reviews']):
+        ids = np.arange(start + 1, start + size + 1)
+        user_ids = skewed_ids(rng, sizes['users'], size)
+        comments = rng.choice(COMMENTS, size).astype(object)
+        comments[rng.random(size) < 0.2] = None
+        _insert(conn, 'reviews', ('id', 'user_id', 'comment'),
+                zip(ids.tolist(), user_ids.tolist(), comments.tolist()))
+
+def dataset_path(total_rows, seed=42, indexes=True):
+    # Builds without the secondary indexes are cached under their own name
+    suffix = "" if indexes else "_noindexes"
+    return os.path.join(GENERATED_DIR, f"sf_{total_rows}_seed{seed}{suffix}.db")
+
+def generate_dataset(total_rows, seed=42, indexes=True, force=False) -> str:
+    """
+    Generate (or reuse the cached) dataset with about total_rows rows
+    Data is bulk-loaded with journaling and syncing disabled, then indexed
+    and ANALYZEd so the planner and the plan cost model see real statistics.
+    Returns the database file path.
+    """
+    os.makedirs(GENERATED_DIR, exist_ok=True)
+    path = dataset_path(total_rows, seed, indexes)
+    if os.path.exists(path) and not force:
+        return path
+
+    # Build into a temporary file so an interrupted load is never reused
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    conn = sqlite3.connect(partial)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        with conn:
+            _load(conn, table_sizes(total_rows), np.random.default_rng(seed))
+        if indexes:
+            with conn:
+                for statement in INDEXES:
+                    conn.execute(statement)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(partial, path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset for performance scoring")
+    parser.add_argument("scale", type=parse_scale, help="Approximate total rows, e.g. 1K, 10M, 100M")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-indexes", action="store_true", help="Skip the secondary indexes")
+    parser.add_argument("--force", action="store_true", help="Regenerate even if cached")
+    args = parser.parse_args()
+
+    cached = os.path.exists(dataset_path(args.scale, args.seed)) and not args.force
+    path = generate_dataset(args.scale, args.seed, indexes=not args.no_indexes, force=args.force)
+    print(f"{'Using cached' if cached else 'Generated'} dataset: {path}")
+    print(f"Score against it with: DB_PATH={path} python main.py ...")
+
+if __name__ == "__main__":
+    main()
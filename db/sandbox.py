@@ -0,0 +1,149 @@
+import sys
+import time
+import threading
+from dataclasses import dataclass
+import psutil
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from db.config import SANDBOX_TIMEOUT, SANDBOX_MEMORY_MB, SANDBOX_MAX_ROWS
+
+# How often the watcher checks the deadline, cancellation and memory (seconds)
+POLL_INTERVAL = 0.01
+
+@dataclass(frozen=True)
+class Limits:
+    """Limits of one query run; 0 disables a limit"""
+    timeout: float = SANDBOX_TIMEOUT  # Wall-clock seconds
+    memory_mb: float = SANDBOX_MEMORY_MB  # Growth of this process's RSS (embedded engines)
+    max_rows: int = SANDBOX_MAX_ROWS  # Rows the query may return
+
+class LimitExceeded(Exception):
+    """
+    A run stopped by the sandbox. reason is 'timeout', 'memory', 'rows' or
+    'cancelled'; resources are those of the stopped run
+    """
+
+    def __init__(self, reason, message, resources=None):
+        super().__init__(message)
+        self.reason = reason
+        self.resources = resources
+
+def _max_rss():
+    """
+    Peak RSS of this process so far in bytes, from getrusage: unlike
+    psutil's memory_info it reads no /proc file, so polling it does not
+    show up in the I/O counters of the run being measured
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+class Sandbox:
+    """
+    Guards one query run on conn (a SQLAlchemy connection). A watcher
+    thread interrupts the statement through the backend once the run passes
+    its deadline, grows this process's memory past the cap (embedded
+    engines) or cancel (a threading.Event) is set; the engine's error is
+    then raised as LimitExceeded. Peak RSS and CPU time of the run are
+    recorded either way.
+    Memory is per process, so the cap is only enforced while this is the
+    only sandboxed run: with runs on parallel threads (the service, --compare,
+    --regression) one query could otherwise trip another's cap
+    """
+
+    # Runs currently inside a sandbox, in this process
+    _active = 0
+    _active_lock = threading.Lock()
+
+    def __init__(self, conn, backend, limits=None, cancel=None):
+        self.conn = conn
+        self.backend = backend
+        self.limits = limits or Limits()
+        self.cancel = cancel
+        self.reason = None
+        self.peak_rss = None
+        self.cpu_seconds = None
+        self._process = psutil.Process()
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise LimitExceeded("cancelled", "Query cancelled before it started")
+        self.backend.apply_limits(self.conn, self.limits)
+        self._dbapi_connection = self.conn.connection.dbapi_connection
+        self._baseline = self.peak_rss = self._process.memory_info().rss
+        self._start_max_rss = _max_rss()
+        self._start_cpu = time.process_time()
+        self._deadline = time.monotonic() + self.limits.timeout if self.limits.timeout else None
+        with Sandbox._active_lock:
+            Sandbox._active += 1
+        self._thread = threading.Thread(target=self._watch, name="sql-scorer-sandbox", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done.set()
+        self._thread.join()
+        with Sandbox._active_lock:
+            Sandbox._active -= 1
+        self.cpu_seconds = time.process_time() - self._start_cpu
+        self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+        if self.reason is not None:
+            raise LimitExceeded(self.reason, self._message(), self.resources()) from exc
+        return False
+
+    def _rss(self):
+        """
+        RSS to check against the cap while the run is measured. The process
+        peak only says something about this run once the run has raised it;
+        without getrusage, fall back to psutil (which reads /proc)
+        """
+        if self._start_max_rss is None:
+            return self._process.memory_info().rss
+        max_rss = _max_rss()
+        return max_rss if max_rss > self._start_max_rss else self._baseline
+
+    def _watch(self):
+        memory_cap = self.limits.memory_mb * 1024 * 1024 if self.backend.embedded else 0
+        while not self._done.wait(POLL_INTERVAL):
+            rss = self._rss()
+            self.peak_rss = max(self.peak_rss, rss)
+            if self.cancel is not None and self.cancel.is_set():
+                self.reason = "cancelled"
+            elif self._deadline is not None and time.monotonic() > self._deadline:
+                self.reason = "timeout"
+            elif memory_cap and rss - self._baseline > memory_cap and Sandbox._active == 1:
+                self.reason = "memory"
+            else:
+                continue
+            try:
+                self.backend.interrupt(self._dbapi_connection)
+            except Exception as e:
+                print(f"Failed to interrupt query: {e}", file=sys.stderr)
+            return
+
+    def check_rows(self, rows):
+        """Called while consuming results; stops the run past max_rows"""
+        if self.limits.max_rows and rows > self.limits.max_rows:
+            self.reason = "rows"
+            raise LimitExceeded("rows", self._message())
+
+    def resources(self):
+        """Resource usage of the run so far"""
+        return {
+            "peak_rss_bytes": self.peak_rss,
+            "memory_growth_bytes": self.peak_rss - self._baseline,
+            "cpu_seconds": self.cpu_seconds,
+        }
+
+    def _message(self):
+        return {
+            "timeout": f"Query exceeded the time limit of {self.limits.timeout:g}s",
+            "memory": f"Query exceeded the memory limit of {self.limits.memory_mb:g} MB",
+            "rows": f"Query returned more than {self.limits.max_rows} rows",
+            "cancelled": "Query cancelled",
+        }[self.reason]
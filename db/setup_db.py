@@ -6,62 +6,62 @@ from db.config import DB_URL
 data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 os.makedirs(data_dir, exist_ok=True)
 
-# Set up database URL
-DB_URL = f"sqlite:///{os.path.join(data_dir, 'test.db')}"
 engine = create_engine(DB_URL)
 
+# Schema shared with the data generator
+SCHEMA = [
+    # USERS
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        age INTEGER NOT NULL
+    );
+    """,
+    # ORDERS
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        order_date TEXT NOT NULL,
+        total_price REAL NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    """,
+    # PRODUCTS
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        price REAL NOT NULL
+    );
+    """,
+    # ORDER_ITEMS
+    """
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES orders(id),
+        FOREIGN KEY (product_id) REFERENCES products(id)
+    );
+    """,
+    # REVIEWS
+    """
+    CREATE TABLE IF NOT EXISTS reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        comment TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    """,
+]
+
 def setup_database():
     with engine.connect() as conn:
-        # USERS
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                age INTEGER NOT NULL
-            );
-        """))
-
-        # ORDERS
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                order_date TEXT NOT NULL,
-                total_price REAL NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            );
-        """))
-
-        # PRODUCTS
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                price REAL NOT NULL
-            );
-        """))
-
-        # ORDER_ITEMS
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS order_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                FOREIGN KEY (order_id) REFERENCES orders(id),
-                FOREIGN KEY (product_id) REFERENCES products(id)
-            );
-        """))
-
-        # REVIEWS
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                comment TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            );
-        """))
+        for statement in SCHEMA:
+            conn.execute(text(statement))
 
         # Sample Data
         conn.execute(text("DELETE FROM users;"))
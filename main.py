@@ -1,20 +1,161 @@
-from scorer.scorer import score_query
-import sqlfluff
+# Only the standard library is imported up front: the scorer (SQLAlchemy,
+# numpy, sqlfluff) loads when a command needs it, so --help and commands
+# served by the daemon start immediately
 import argparse
+import json
+import sys
+from contextlib import redirect_stdout
+from scorer import cli_daemon
+from db.config import DAEMON_SOCKET, SCORE_MANIFEST
 
 def get_optimized_query(query):
     """Get the optimized version of a query using sqlfluff"""
+    from scorer.scorer import fix_sql
     try:
-        return sqlfluff.fix(query, dialect="postgres") or query
+        return fix_sql(query)
     except Exception as e:
         print(f"Error optimizing query: {e}")
         return query
 
-def main():
+def run_batch(paths, workers, incremental=False, watch=False, manifest=None, **score_options):
+    """
+    Score every query found in paths, printing one JSON result per line
+    incremental: only re-score queries whose file, tables or scoring options
+    changed since the last run (see scorer.incremental); watch: keep doing so
+    whenever a file changes
+    """
+    if incremental or watch:
+        from scorer.incremental import score_changed
+        results = score_changed(paths, manifest_path=manifest or SCORE_MANIFEST, watch=watch,
+                                workers=workers, **score_options)
+    else:
+        from scorer.batch import iter_queries, score_queries
+        results = score_queries(iter_queries(paths), workers=workers, **score_options)
+    # stdout carries only the JSON lines: diagnostics printed while scoring go to stderr
+    out = sys.stdout
+    try:
+        with redirect_stdout(sys.stderr):
+            for result in results:
+                print(json.dumps(result), file=out, flush=True)
+    except KeyboardInterrupt:
+        if not watch:
+            raise
+
+def run_compare(paths, rounds, warmup, workers):
+    """Benchmark query variants on isolated snapshots and print a ranked table"""
+    from scorer.compare import compare_queries, format_comparison
+    try:
+        queries = []
+        for path in paths:
+            with open(path, "r") as f:
+                queries.append(f.read().strip())
+    except Exception as e:
+        print(f"Error reading files: {e}")
+        return
+
+    try:
+        rows = compare_queries(queries, names=paths, rounds=rounds, warmup=warmup, workers=workers)
+    except (OSError, ValueError) as e:
+        print(f"Cannot compare queries: {e}")
+        return
+    print(format_comparison(rows))
+
+def run_regression(paths, before, after, ddl, limit, rounds, warmup, workers):
+    """
+    Benchmark a query corpus on two databases and print per-group speedups
+    Returns the exit code: 1 if any query group got significantly slower
+    """
+    from itertools import islice
+    from scorer.batch import iter_queries
+    from sqlalchemy.exc import SQLAlchemyError
+    from scorer.regression import regression_targets, compare_targets, format_regression, regressions
+    queries = [query for _, query in islice(iter_queries(paths), limit)]
+    try:
+        with regression_targets(before, after, ddl) as urls:
+            rows = compare_targets(queries, urls, rounds=rounds, warmup=warmup, parallel=workers != 1)
+    except (OSError, ValueError, SQLAlchemyError) as e:
+        print(f"Error preparing databases: {e}")
+        return 2
+    print(format_regression(rows))
+    return 1 if regressions(rows) else 0
+
+def build_parser():
     parser = argparse.ArgumentParser(description="SQL Query Scorer and Optimizer")
-    parser.add_argument("query1", help="First SQL query file")
-    parser.add_argument("query2", help="Second SQL query file")
-    args = parser.parse_args()
+    parser.add_argument("query1", nargs="?", help="First SQL query file")
+    parser.add_argument("query2", nargs="?", help="Second SQL query file")
+    parser.add_argument("--batch", nargs="+", metavar="PATH",
+                        help="Score all queries in these files/directories (.sql, .csv, .jsonl) as JSON lines")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --batch: only re-score queries that changed, or whose tables changed, "
+                             "since the last run (others are reported from the manifest)")
+    parser.add_argument("--watch", action="store_true",
+                        help="With --batch: score incrementally, then re-score whenever a file or the schema changes")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help=f"Manifest of --incremental runs (default: {SCORE_MANIFEST})")
+    parser.add_argument("--compare", nargs="+", metavar="FILE",
+                        help="Benchmark N query variants against each other on isolated database snapshots")
+    parser.add_argument("--regression", nargs="+", metavar="PATH",
+                        help="Benchmark a query corpus on --before and --after and report per-group speedups "
+                             "(exit code 1 if any group got significantly slower)")
+    parser.add_argument("--before", metavar="DB",
+                        help="Baseline for --regression: SQLite file or database URL (default: the configured database)")
+    parser.add_argument("--after", metavar="DB", help="Candidate for --regression: SQLite file or database URL")
+    parser.add_argument("--ddl", metavar="FILE",
+                        help="With --regression: compare --before against a copy with this script applied")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="With --regression: only the first N queries of the corpus")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes for batch analysis (threads for --compare)")
+    parser.add_argument("--warmup", type=int, default=None,
+                        help="Benchmark warmup runs discarded before measuring")
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="Benchmark runs measured per query (rounds for --compare, default 10)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Score from static analysis, EXPLAIN and history without executing the queries")
+    parser.add_argument("--trace", action="store_true",
+                        help="Print per-stage timings (wall and CPU) of each scored query")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run scoring under cProfile and save the stats under data/profiles")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep a warm process serving later invocations over a local socket")
+    parser.add_argument("--stop-daemon", action="store_true", help="Stop a running daemon")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Run in this process even if a daemon is running")
+    return parser
+
+def run(args, parser):
+    """Run a parsed invocation in this process"""
+    # Only force profiling on; otherwise sample at SQL_SCORER_PROFILE_RATE
+    profile = True if args.profile else None
+
+    if args.batch:
+        run_batch(args.batch, args.workers, incremental=args.incremental, watch=args.watch,
+                  manifest=args.manifest, warmup=args.warmup, iterations=args.iterations,
+                  dry_run=args.dry_run, trace=args.trace, profile=profile)
+        return
+
+    if args.compare:
+        run_compare(
+            args.compare,
+            rounds=args.iterations or 10,
+            warmup=1 if args.warmup is None else args.warmup,
+            workers=args.workers,
+        )
+        return
+
+    if args.regression:
+        exit_code = run_regression(
+            args.regression, args.before, args.after, args.ddl, args.limit,
+            rounds=args.iterations or 10,
+            warmup=1 if args.warmup is None else args.warmup,
+            workers=args.workers,
+        )
+        if exit_code:
+            sys.exit(exit_code)
+        return
+
+    if not args.query1 or not args.query2:
+        parser.error("query1 and query2 are required unless --batch, --compare or --regression is given")
 
 
     try:
@@ -24,9 +165,17 @@ def main():
         print(f"Error reading files: {e}")
         return
 
-    
-    score1 = score_query(query1)
-    score2 = score_query(query2)
+    from scorer.scorer import score_query
+    from scorer.tracing import format_trace
+    score1 = score_query(query1, warmup=args.warmup, iterations=args.iterations, dry_run=args.dry_run,
+                         trace=args.trace, profile=profile)
+    score2 = score_query(query2, warmup=args.warmup, iterations=args.iterations, dry_run=args.dry_run,
+                         trace=args.trace, profile=profile)
+
+    if args.trace:
+        for label, score in (("Query 1", score1), ("Query 2", score2)):
+            print(f"\n{label} stages:")
+            print(format_trace(score["trace"]))
 
     
     if score1["score"] > score2["score"]:
@@ -42,5 +191,34 @@ def main():
     print("\nOptimized version of the better query:")
     print(get_optimized_query(better_query))
 
+def run_argv(argv):
+    """Parse and run an invocation in this process (the daemon's entry point)"""
+    parser = build_parser()
+    run(parser.parse_args(argv), parser)
+
+def main():
+    argv = sys.argv[1:]
+    args = build_parser().parse_args(argv)
+
+    if args.stop_daemon:
+        if not cli_daemon.stop(DAEMON_SOCKET):
+            print("No daemon is running")
+        return
+    if args.daemon:
+        # Load everything now so the first served command is already warm
+        import sqlfluff
+        import scorer.batch
+        import scorer.compare
+        import scorer.incremental
+        cli_daemon.serve(DAEMON_SOCKET, run_argv)
+        return
+
+    # A watch never ends, so it would hold the daemon for everyone else
+    if not args.no_daemon and not args.watch:
+        exit_code = cli_daemon.forward(argv, DAEMON_SOCKET)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    run_argv(argv)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+# The scorer is imported where queries are scored, so reading query files
+# (e.g. for an incremental run with nothing to re-score) stays cheap
+import os
+import csv
+import json
+import sqlparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+# Column holding the statement text in pg_stat_statements CSV/JSONL exports
+QUERY_FIELD = "query"
+
+def query_files(paths: List[str]) -> List[str]:
+    """Files iter_queries reads: the given files, and every *.sql file (sorted) of the given directories"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.endswith(".sql")
+            ))
+        else:
+            files.append(path)
+    return files
+
+def read_queries(path: str) -> Iterator[Tuple[str, str]]:
+    """(source, query) pairs of one file (see iter_queries)"""
+    if path.endswith(".csv"):
+        with open(path, "r", newline="") as f:
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                query = (row.get(QUERY_FIELD) or "").strip()
+                if query:
+                    yield f"{path}:{line_no}", query
+    elif path.endswith(".jsonl"):
+        with open(path, "r") as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                query = (json.loads(line).get(QUERY_FIELD) or "").strip()
+                if query:
+                    yield f"{path}:{line_no}", query
+    else:
+        with open(path, "r") as f:
+            statements = [s.strip() for s in sqlparse.split(f.read()) if s.strip()]
+        if len(statements) == 1:
+            yield path, statements[0]
+        else:
+            for index, statement in enumerate(statements, start=1):
+                yield f"{path}#{index}", statement
+
+def iter_queries(paths: List[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Read queries from files and directories
+    Yields (source, query) pairs. Supported inputs:
+    - directories (every *.sql file, sorted)
+    - .sql files (one or more ;-separated statements)
+    - .csv files with a 'query' column (e.g. a pg_stat_statements dump)
+    - .jsonl files with a 'query' field per line
+    """
+    for path in query_files(paths):
+        yield from read_queries(path)
+
+def _prepare(item: Tuple[str, str], db_url=None):
+    """Worker entry point: lint (in db_url's dialect) and normalize one query"""
+    from scorer.scorer import prepare_query
+    source, query = item
+    try:
+        return source, query, prepare_query(query, db_url), None
+    except Exception as e:
+        return source, query, None, str(e)
+
+def score_queries(queries: Iterable[Tuple[str, str]], workers=None, prefetch=32, **score_options) -> Iterator[dict]:
+    """
+    Score many queries, yielding one result per query in input order
+    Linting and normalization run in a process pool, while execution and
+    EXPLAIN run one at a time in this process so that timings are not
+    skewed by concurrent queries competing for the database.
+    At most `prefetch` queries are analyzed ahead of execution.
+    score_options are passed on to score_query (e.g. warmup, iterations)
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in queries:
+            pending.append(pool.submit(_prepare, item, score_options.get("db_url")))
+            if len(pending) >= prefetch:
+                yield _score_prepared(*pending.popleft().result(), score_options)
+        while pending:
+            yield _score_prepared(*pending.popleft().result(), score_options)
+
+def _score_prepared(source, query, analysis, error, score_options):
+    """Execute and score a query whose analysis has already been done"""
+    if error is not None:
+        return {"source": source, "query": query, "error": f"Analysis failed: {error}", "score": 0}
+    from scorer.scorer import score_query
+    result = score_query(analysis, **score_options)
+    return {"source": source, "query": query, **result}
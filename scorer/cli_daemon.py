@@ -0,0 +1,159 @@
+import io
+import os
+import sys
+import json
+import socket
+import hashlib
+import threading
+import traceback
+import socketserver
+from contextlib import redirect_stdout, redirect_stderr
+
+# Repository root: main.py and the scorer and db packages
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Environment variables that change what a command does
+CONFIG_PREFIXES = ("DB_", "SQL_SCORER_")
+CODE_DIRS = ("scorer", "db")
+
+def code_paths():
+    """Source files of the CLI and the scorer"""
+    paths = [os.path.join(ROOT_DIR, "main.py")]
+    for directory in CODE_DIRS:
+        for name in sorted(os.listdir(os.path.join(ROOT_DIR, directory))):
+            if name.endswith(".py"):
+                paths.append(os.path.join(ROOT_DIR, directory, name))
+    return paths
+
+def fingerprint():
+    """
+    Identity of the configuration and code a process runs with. A daemon
+    only serves clients with the same fingerprint, so changing DB_URL or
+    editing the code never gives results from a stale process.
+    """
+    settings = sorted((k, v) for k, v in os.environ.items() if k.startswith(CONFIG_PREFIXES))
+    code = max(os.stat(path).st_mtime_ns for path in code_paths())
+    return hashlib.sha256(json.dumps([settings, code]).encode()).hexdigest()
+
+class _StreamWriter(io.TextIOBase):
+    """Text stream forwarding writes to the client as JSON lines"""
+
+    def __init__(self, wfile, name):
+        self.wfile = wfile
+        self.name = name
+
+    def write(self, text):
+        if text:
+            self.wfile.write((json.dumps({self.name: text}) + "\n").encode())
+            self.wfile.flush()
+        return len(text)
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            if request.get("command") == "stop":
+                self._send({"exit": 0})
+                threading.Thread(target=self.server.shutdown).start()
+            elif request.get("fingerprint") != self.server.fingerprint:
+                self._send({"refused": "daemon runs with different configuration or code"})
+            else:
+                self._send({"exit": self._run(request["argv"], request["cwd"])})
+        except OSError:
+            # Client went away mid-command
+            pass
+
+    def _run(self, argv, cwd):
+        previous_cwd = os.getcwd()
+        stdout, stderr = _StreamWriter(self.wfile, "stdout"), _StreamWriter(self.wfile, "stderr")
+        try:
+            os.chdir(cwd)
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    self.server.command(argv)
+                except SystemExit as e:
+                    return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception:
+                    traceback.print_exc()
+                    return 1
+            return 0
+        finally:
+            os.chdir(previous_cwd)
+
+    def _send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+def serve(socket_path, command):
+    """
+    Serve CLI invocations on a Unix socket until stopped
+    command(argv) runs one invocation; commands run one at a time so
+    timings are never taken while another command runs
+    """
+    if os.path.exists(socket_path):
+        if _connect(socket_path) is not None:
+            print(f"A daemon is already listening on {socket_path}")
+            return
+        os.remove(socket_path)
+
+    server = socketserver.UnixStreamServer(socket_path, _DaemonHandler)
+    server.command = command
+    server.fingerprint = fingerprint()
+    os.chmod(socket_path, 0o600)
+    print(f"SQL-Scorer daemon listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def _connect(socket_path):
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+def forward(argv, socket_path):
+    """
+    Run a CLI invocation in a running daemon, relaying its output
+    Returns the exit code, or None when no daemon can serve it
+    """
+    client = _connect(socket_path)
+    if client is None:
+        return None
+    with client, client.makefile("rwb") as stream:
+        request = {"argv": argv, "cwd": os.getcwd(), "fingerprint": fingerprint()}
+        stream.write((json.dumps(request) + "\n").encode())
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+            elif "refused" in message:
+                print(f"Not using the daemon ({message['refused']}), running locally", file=sys.stderr)
+                return None
+            elif "exit" in message:
+                return message["exit"]
+    print("The daemon closed the connection before finishing", file=sys.stderr)
+    return 1
+
+def stop(socket_path):
+    """Ask a running daemon to exit; returns False if none is running"""
+    client = _connect(socket_path)
+    if client is None:
+        return False
+    with client, client.makefile("rwb") as stream:
+        stream.write(b'{"command": "stop"}\n')
+        stream.flush()
+        stream.readline()
+    return True
@@ -0,0 +1,150 @@
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from scorer.scorer import (
+    OPTIMIZATION_CATEGORIES, READABILITY_PREFIXES, OPTIMIZATION_WEIGHT, READABILITY_WEIGHT, DECAY,
+)
+from scorer.performance_metrics import calculate_dynamic_thresholds, DEFAULT_THRESHOLDS
+from scorer.query_analysis import QueryAnalysis
+
+def _column(values) -> np.ndarray:
+    """Float column; None becomes NaN"""
+    return np.asarray(values, dtype=float)
+
+def normalized_scores(base_score: float, penalties, max_penalties) -> np.ndarray:
+    """Column version of scorer.scorer.calculate_normalized_score"""
+    penalties, max_penalties = _column(penalties), _column(max_penalties)
+    safe_max = np.where(max_penalties == 0, 1.0, max_penalties)
+    decayed = base_score * np.exp(-DECAY * np.minimum(penalties / safe_max, 1.0))
+    return np.where(max_penalties == 0, base_score, decayed)
+
+def threshold_scores(values, thresholds, max_score=25) -> np.ndarray:
+    """Column version of performance_metrics.threshold_score"""
+    values, thresholds = _column(values), _column(thresholds)
+    positive = thresholds > 0
+    safe = np.where(positive, thresholds, 1.0)
+    linear = np.maximum(0, max_score * (1 - values / safe))
+    return np.where(positive, linear, np.where(values <= 0, max_score, 0.0))
+
+def performance_scores(execution_time, cpu_usage, exec_threshold, cpu_threshold) -> np.ndarray:
+    """
+    Column version of calculate_performance_score with the thresholds given
+    Rows without a CPU figure (NaN) weigh execution time alone
+    """
+    exec_score = threshold_scores(execution_time, exec_threshold)
+    cpu_usage = _column(cpu_usage)
+    cpu_score = threshold_scores(np.nan_to_num(cpu_usage), cpu_threshold)
+    return np.where(np.isnan(cpu_usage), 2 * exec_score, exec_score + cpu_score)
+
+def explain_scores(cost) -> np.ndarray:
+    """Column version of the explain score of analyze_explain_plan, from the plan cost (rows touched)"""
+    return np.maximum(0.0, 10 - 1.5 * np.log10(np.maximum(_column(cost), 1.0)))
+
+def static_scores(optimization_violations, readability_violations, readability_categories,
+                  explain_score) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Column version of calculate_static_scores: (optimization, readability)
+    Inputs are per-query counts as returned by violation_columns
+    """
+    opt_score = normalized_scores(
+        30, _column(optimization_violations) * OPTIMIZATION_WEIGHT,
+        len(OPTIMIZATION_CATEGORIES) * OPTIMIZATION_WEIGHT
+    )
+    opt_score = np.minimum(30, opt_score + _column(explain_score))
+    read_score = normalized_scores(
+        20, _column(readability_violations) * READABILITY_WEIGHT,
+        _column(readability_categories) * READABILITY_WEIGHT
+    )
+    return opt_score, read_score
+
+def violation_columns(violation_summaries: Iterable[Dict[str, int]]) -> Dict[str, np.ndarray]:
+    """
+    Reduce violation summaries (rule category -> count) to the three count
+    columns the static scores need
+    """
+    optimization, readability, categories = [], [], []
+    for violations in violation_summaries:
+        optimization.append(sum(violations.get(c, 0) for c in OPTIMIZATION_CATEGORIES))
+        layout = [count for category, count in violations.items() if category.startswith(READABILITY_PREFIXES)]
+        readability.append(sum(layout))
+        categories.append(len(layout))
+    return {
+        "optimization_violations": np.asarray(optimization, dtype=np.int64),
+        "readability_violations": np.asarray(readability, dtype=np.int64),
+        "readability_categories": np.asarray(categories, dtype=np.int64),
+    }
+
+def group_thresholds(groups: Sequence[str], thresholds: Dict[str, Tuple[float, Optional[float]]]):
+    """
+    Expand per-group (exec, cpu) thresholds to one row per query
+    Groups missing from thresholds get DEFAULT_THRESHOLDS; returns (exec, cpu) columns
+    """
+    unique, inverse = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+    exec_by_group = np.empty(len(unique))
+    cpu_by_group = np.empty(len(unique))
+    for i, group in enumerate(unique):
+        exec_threshold, cpu_threshold = thresholds.get(group, DEFAULT_THRESHOLDS)
+        exec_by_group[i] = exec_threshold
+        cpu_by_group[i] = DEFAULT_THRESHOLDS[1] if cpu_threshold is None else cpu_threshold
+    return exec_by_group[inverse], cpu_by_group[inverse]
+
+def load_group_thresholds(queries: Iterable[Tuple[str, str]], window="all") -> Dict[str, Tuple[float, float]]:
+    """
+    Thresholds of each query group, from (group, query) pairs: those
+    score_query uses (calculate_dynamic_thresholds, which merges in similar
+    groups), looked up once per distinct group with its first query
+    """
+    representatives = {}
+    for group, query in queries:
+        representatives.setdefault(group, query)
+    return {
+        group: calculate_dynamic_thresholds(QueryAnalysis.from_query(query), window=window)
+        for group, query in representatives.items()
+    }
+
+def score_columns(execution_time, cpu_usage, optimization_violations, readability_violations,
+                  readability_categories, explain_score, exec_threshold, cpu_threshold) -> Dict[str, np.ndarray]:
+    """
+    Score many queries at once from columns of equal length, with the same
+    results as score_query's scalar arithmetic
+    Returns a table as a dict of NumPy columns, which pandas.DataFrame and
+    pyarrow.table accept as is: performance, optimization, readability, score
+    """
+    performance = performance_scores(execution_time, cpu_usage, exec_threshold, cpu_threshold)
+    optimization, readability = static_scores(
+        optimization_violations, readability_violations, readability_categories, explain_score
+    )
+    return {
+        "performance": performance,
+        "optimization": optimization,
+        "readability": readability,
+        "score": np.round(performance + optimization + readability, 2),
+    }
+
+def score_results(results: List[dict], groups: Optional[Sequence[str]] = None,
+                  thresholds: Optional[Dict[str, Tuple[float, Optional[float]]]] = None,
+                  window="all") -> Dict[str, np.ndarray]:
+    """
+    Re-score score_query results (e.g. a --batch report) in one pass, with
+    the thresholds score_query would use now (see load_group_thresholds)
+    groups: query group of each result, derived from its query if not given
+    thresholds: per-group thresholds to use instead of loading them
+    Failed results score NaN
+    """
+    queries = [r.get("query") or "" for r in results]
+    if groups is None:
+        group_of = {query: QueryAnalysis.from_query(query).group for query in set(queries) if query}
+        groups = [group_of.get(query, "") for query in queries]
+    if thresholds is None:
+        thresholds = load_group_thresholds(
+            ((group, query) for group, query in zip(groups, queries) if query), window
+        )
+    exec_threshold, cpu_threshold = group_thresholds(groups, thresholds)
+    columns = violation_columns(r.get("violation_summary") or {} for r in results)
+    return score_columns(
+        execution_time=[r.get("execution_time") for r in results],
+        cpu_usage=[r.get("cpu_usage") for r in results],
+        explain_score=explain_scores([(r.get("explain_estimate") or {}).get("cost") for r in results]),
+        exec_threshold=exec_threshold,
+        cpu_threshold=cpu_threshold,
+        **columns,
+    )
@@ -0,0 +1,116 @@
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+from db.database import benchmark_sql, snapshot_database, dispose_engine, reject_outliers, summarize_samples
+from db.sandbox import LimitExceeded
+from scorer.scorer import prepare_query
+from scorer.statistics import mann_whitney_u
+
+def run_once(query, db_url):
+    """Time a single (rolled back) run of query on db_url, or None on error"""
+    try:
+        benchmark = benchmark_sql(query, warmup=0, iterations=1, db_url=db_url)
+    except LimitExceeded as e:
+        print(f"Query stopped: {e}", file=sys.stderr)
+        return None
+    return None if benchmark is None else benchmark["execution_time"]["median"]
+
+def compare_queries(queries: List[str], names: Optional[List[str]] = None,
+                    rounds=10, warmup=1, workers=None, alpha=0.05) -> List[dict]:
+    """
+    Benchmark N query variants against each other and rank them
+    Each variant runs on its own snapshot of the database, so one variant's
+    writes cannot change another's data. Runs are grouped in rounds: within
+    a round every variant runs once, in parallel across `workers` threads,
+    and the starting order rotates every round so no variant is always
+    first (or last) to touch a warm cache.
+    Snapshots are SQLite copies, so the configured database must be a
+    SQLite file (see snapshot_database).
+    Returns rows sorted by median time, each with a Mann-Whitney p-value
+    against the fastest variant.
+    """
+    names = names or [f"Query {i + 1}" for i in range(len(queries))]
+    count = len(queries)
+    workers = workers or min(count, os.cpu_count() or 1)
+
+    samples = [[] for _ in queries]
+    failed = [False] * count
+    with tempfile.TemporaryDirectory(prefix="sql-scorer-") as snapshot_dir:
+        # Before linting, which opens the performance history next to a SQLite target
+        urls = [
+            snapshot_database(os.path.join(snapshot_dir, f"variant_{i}.db"))
+            for i in range(count)
+        ]
+        try:
+            with ProcessPoolExecutor(max_workers=min(count, os.cpu_count() or 1)) as pool:
+                analyses = list(pool.map(prepare_query, queries))
+
+            with ThreadPoolExecutor(max_workers=workers) as threads:
+                for round_index in range(warmup + rounds):
+                    offset = round_index % count
+                    order = list(range(offset, count)) + list(range(offset))
+                    futures = {
+                        i: threads.submit(run_once, queries[i], urls[i])
+                        for i in order if not failed[i]
+                    }
+                    for i, future in futures.items():
+                        elapsed = future.result()
+                        if elapsed is None:
+                            failed[i] = True
+                        elif round_index >= warmup:
+                            samples[i].append(elapsed)
+        finally:
+            for url in urls:
+                dispose_engine(url)
+
+    rows = []
+    for i in range(count):
+        row = {
+            "name": names[i],
+            "query": queries[i],
+            "violations": sum(analyses[i].violation_summary.values()),
+        }
+        if failed[i] or not samples[i]:
+            row["error"] = "Query execution failed."
+        else:
+            kept, rejected = reject_outliers(samples[i])
+            row.update(summarize_samples(kept))
+            row["rejected_outliers"] = rejected
+        rows.append(row)
+
+    ranked = sorted((r for r in rows if "error" not in r), key=lambda r: r["median"])
+    if ranked:
+        best = ranked[0]
+        best_samples = samples[rows.index(best)]
+        for rank, row in enumerate(ranked, start=1):
+            row["rank"] = rank
+            row["relative"] = row["median"] / best["median"] if best["median"] > 0 else 1.0
+            if row is best:
+                row["p_value"] = None
+                row["significant"] = None
+            else:
+                _, p_value = mann_whitney_u(samples[rows.index(row)], best_samples)
+                row["p_value"] = p_value
+                row["significant"] = p_value < alpha
+    return ranked + [r for r in rows if "error" in r]
+
+def format_comparison(rows: List[dict]) -> str:
+    """Render compare_queries rows as a text table"""
+    lines = [
+        f"{'#':>2}  {'Variant':<20} {'Median (ms)':>12} {'p95 (ms)':>10} {'95% CI (ms)':>19} "
+        f"{'x best':>7} {'p-value':>8}  Significant"
+    ]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"{'-':>2}  {row['name']:<20} {row['error']}")
+            continue
+        ci = f"{row['ci_low'] * 1000:.3f}-{row['ci_high'] * 1000:.3f}"
+        p_value = "-" if row["p_value"] is None else f"{row['p_value']:.4f}"
+        significant = "-" if row["significant"] is None else ("yes" if row["significant"] else "no")
+        lines.append(
+            f"{row['rank']:>2}  {row['name']:<20} {row['median'] * 1000:>12.3f} {row['p95'] * 1000:>10.3f} "
+            f"{ci:>19} {row['relative']:>7.2f} {p_value:>8}  {significant}"
+        )
+    return "\n".join(lines)
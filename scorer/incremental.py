@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy.exc import SQLAlchemyError
+from scorer import cli_daemon
+from db.config import DB_URL, SCORE_MANIFEST
+from db.database import get_engine
+from db.backends import get_backend
+from scorer.batch import query_files, read_queries, score_queries
+
+# Bumped when the manifest layout changes; older manifests are discarded
+MANIFEST_VERSION = 1
+# How often --watch looks for changed files (seconds)
+WATCH_INTERVAL = 1.0
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def load_manifest(path=SCORE_MANIFEST) -> dict:
+    """The manifest of an earlier run, or an empty one"""
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {path}: {e}", file=sys.stderr)
+        return {}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {}
+
+def save_manifest(manifest: dict, path=SCORE_MANIFEST):
+    """Write the manifest atomically, so an interrupted run leaves the previous one"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump({**manifest, "version": MANIFEST_VERSION}, f)
+    os.replace(temporary, path)
+
+def scoring_context(score_options: dict) -> str:
+    """
+    Digest of what every result depends on besides its query and tables:
+    the target database, the score options and the scorer's code. Results
+    recorded under another context are never reused
+    """
+    code = hashlib.sha256()
+    for path in cli_daemon.code_paths():
+        with open(path, "rb") as f:
+            code.update(f.read())
+    options = {name: value for name, value in score_options.items() if name not in ("db_url", "profile")}
+    context = [score_options.get("db_url") or DB_URL, sorted(options.items()), code.hexdigest()]
+    return _digest(json.dumps(context, default=str).encode())
+
+def table_versions(db_url=None) -> Dict[str, str]:
+    """
+    Version of every table (lower-cased name): a digest of its definition
+    with its indexes and of its row estimate, so both DDL and data loads
+    that change what the planner sees show up
+    """
+    backend = get_backend(db_url)
+    try:
+        with get_engine(db_url).connect() as conn:
+            definitions = backend.table_definitions(conn)
+            table_rows, _ = backend.table_stats(conn)
+    except SQLAlchemyError as e:
+        print(f"Failed to read the schema: {e}", file=sys.stderr)
+        return {}
+    return {
+        table.lower(): _digest(json.dumps([definitions.get(table), table_rows.get(table)]).encode())[:16]
+        for table in set(definitions) | set(table_rows)
+    }
+
+def referenced_tables(query: str, versions: Dict[str, str]) -> Dict[str, str]:
+    """
+    Versions of the tables a query may use: every known table named among
+    its tokens (over-matching, e.g. a column named like a table, only costs
+    an extra re-score)
+    """
+    import sqlparse
+    from scorer.query_matcher import canonical_tokens
+    names = {token.lower() for statement in sqlparse.parse(query) for token in canonical_tokens(statement)}
+    return {table: versions[table] for table in names & versions.keys()}
+
+def _reusable(entry: dict, versions: Dict[str, str]) -> bool:
+    """A recorded result is current if it succeeded and none of its tables changed"""
+    if "error" in entry["result"]:
+        return False
+    return all(versions.get(table) == version for table, version in entry["tables"].items())
+
+def _file_queries(path, previous: Optional[dict]):
+    """
+    (file record, [(source, query, previous entry or None)]) of one file
+    An unchanged size and mtime, or else an unchanged content hash, reuses
+    the recorded queries without parsing the file
+    """
+    stat = os.stat(path)
+    record = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if previous and previous["mtime_ns"] == stat.st_mtime_ns and previous["size"] == stat.st_size:
+        record["hash"] = previous["hash"]
+    else:
+        with open(path, "rb") as f:
+            record["hash"] = _digest(f.read())
+    if previous and previous["hash"] == record["hash"]:
+        return record, [(entry["result"]["source"], entry["result"]["query"], entry) for entry in previous["queries"]]
+
+    recorded = {entry["hash"]: entry for entry in previous["queries"]} if previous else {}
+    return record, [
+        (source, query, recorded.get(_digest(query.encode())))
+        for source, query in read_queries(path)
+    ]
+
+def score_incremental(paths: List[str], manifest: dict, workers=None, only_changed=False,
+                      **score_options) -> Iterator[dict]:
+    """
+    Score the queries in paths, re-scoring only those whose text, tables
+    (see table_versions) or scoring context changed since the run recorded
+    in manifest, which is updated in place. Yields results in input order,
+    with cached set on reused ones (left out when only_changed). Returns
+    whether the manifest changed
+    """
+    context = scoring_context(score_options)
+    recorded_files = manifest.get("files", {}) if manifest.get("context") == context else {}
+    versions = table_versions(score_options.get("db_url"))
+
+    files, items = {}, []
+    for path in query_files(paths):
+        try:
+            record, queries = _file_queries(path, recorded_files.get(path))
+        except (OSError, ValueError) as e:
+            print(f"Error reading {path}: {e}", file=sys.stderr)
+            continue
+        files[path] = record
+        record["queries"] = []
+        for source, query, entry in queries:
+            reuse = entry is not None and _reusable(entry, versions)
+            items.append((record["queries"], source, query, entry if reuse else None))
+
+    changed = context != manifest.get("context") or {
+        path: (record["mtime_ns"], record["size"], record["hash"]) for path, record in files.items()
+    } != {
+        path: (record["mtime_ns"], record["size"], record["hash"]) for path, record in recorded_files.items()
+    }
+    stale = [(source, query) for _, source, query, entry in items if entry is None]
+    scored = None
+    if stale:
+        scored = score_queries(stale, workers=workers, **score_options)
+
+    for entries, source, query, entry in items:
+        if entry is None:
+            result = next(scored)
+            entry = {"hash": _digest(query.encode()), "tables": referenced_tables(query, versions), "result": result}
+            changed = True
+            yield {**result, "cached": False}
+        elif not only_changed:
+            yield {**entry["result"], "source": source, "cached": True}
+        entries.append({**entry, "result": {**entry["result"], "source": source}})
+    if scored is not None:
+        scored.close()
+
+    manifest.update(context=context, files=files)
+    return changed
+
+def score_changed(paths: List[str], manifest_path=SCORE_MANIFEST, watch=False, workers=None,
+                  interval=WATCH_INTERVAL, **score_options) -> Iterator[dict]:
+    """
+    An incremental run over paths (see score_incremental) that keeps its
+    manifest at manifest_path. With watch it then polls the files (and the
+    schema) every interval seconds, yielding only the re-scored results,
+    until interrupted
+    """
+    manifest = load_manifest(manifest_path)
+    only_changed = False
+    while True:
+        changed = yield from score_incremental(paths, manifest, workers, only_changed, **score_options)
+        if changed:
+            save_manifest(manifest, manifest_path)
+        if not watch:
+            return
+        only_changed = True
+        time.sleep(interval)
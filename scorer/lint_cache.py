@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from importlib.metadata import version
+from sqlalchemy import create_engine, Column, String, Text
+from sqlalchemy.orm import declarative_base, sessionmaker
+from db.config import HISTORY_URL, DATA_DIR
+
+# The engine is created and the table checked on first use
+Base = declarative_base()
+Session = sessionmaker()
+_engine = None
+_engine_lock = threading.Lock()
+
+class LintCacheEntry(Base):
+    __tablename__ = 'lint_cache'
+
+    key = Column(String, primary_key=True)  # sha256 of kind, sqlfluff version, dialect and query
+    value = Column(Text)  # JSON encoded result
+
+def cache_session():
+    """New session on the lint cache table, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            engine = create_engine(HISTORY_URL)
+            Base.metadata.create_all(engine)
+            Session.configure(bind=engine)
+            _engine = engine
+    return Session()
+
+@lru_cache(maxsize=None)
+def sqlfluff_version() -> str:
+    """Installed sqlfluff version, read without importing sqlfluff itself"""
+    return version("sqlfluff")
+
+class LintCache:
+    """Two-level (in-memory LRU + SQLite) cache for sqlfluff results"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, query: str, dialect: str) -> str:
+        """Content hash of the query, tied to the sqlfluff version and dialect"""
+        payload = "\0".join((kind, sqlfluff_version(), dialect, query))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        session = cache_session()
+        try:
+            entry = session.get(LintCacheEntry, key)
+        finally:
+            session.close()
+        if entry is None:
+            return None
+
+        value = json.loads(entry.value)
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        """Store value under key in memory and on disk"""
+        self._remember(key, value)
+        session = cache_session()
+        try:
+            session.merge(LintCacheEntry(key=key, value=json.dumps(value)))
+            session.commit()
+        finally:
+            session.close()
+
+    def get_or_compute(self, kind, query, dialect, compute):
+        """Return the cached result, calling compute() and caching it on a miss"""
+        key = self.make_key(kind, query, dialect)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._memory.clear()
+        session = cache_session()
+        try:
+            session.query(LintCacheEntry).delete()
+            session.commit()
+        finally:
+            session.close()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+lint_cache = LintCache()
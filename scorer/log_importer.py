@@ -0,0 +1,251 @@
+import io
+import re
+import csv
+import sys
+import gzip
+import hashlib
+import json
+import argparse
+from datetime import datetime, timezone
+from typing import Iterator, Optional, Tuple
+from collections import OrderedDict, defaultdict
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from db.config import NORMALIZE_CACHE_SIZE
+from scorer.query_analysis import QueryAnalysis
+from scorer.performance_metrics import (
+    get_history_engine, QuerySample, QueryFingerprintRecord, QueryFingerprintBand,
+    fingerprint_rows, update_group_stats, intern_texts, to_epoch, maybe_apply_retention,
+)
+
+# Rows written per transaction
+BATCH_SIZE = 5000
+
+# Postgres csvlog column positions (stable since 9.0)
+CSVLOG_TIME = 0
+CSVLOG_MESSAGE = 13
+DURATION_RE = re.compile(
+    r"duration: ([\d.]+) ms\s+(?:statement|execute [^:]*|parse [^:]*|bind [^:]*): (.*)",
+    re.DOTALL,
+)
+
+# pg_stat_statements exposes mean_exec_time since PG 13, mean_time before
+PGSS_MEAN_COLUMNS = ("mean_exec_time", "mean_time")
+
+# (query, execution time in seconds, cpu usage or None, timestamp or None);
+# parsers yield None for a row they cannot use
+Sample = Tuple[str, float, Optional[float], Optional[datetime]]
+
+def open_log(path):
+    """Open a log file as text, transparently decompressing .gz files"""
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), newline="")
+    return open(path, "r", newline="")
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Parse a log timestamp, accepting a trailing time zone abbreviation"""
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    value = value.strip()
+    parts = value.rsplit(" ", 1)
+    if len(parts) == 2 and parts[1].isalpha():
+        # e.g. '2024-03-20 10:00:00.123 UTC'
+        value = parts[0]
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def parse_csvlog(f) -> Iterator[Optional[Sample]]:
+    """
+    Yield samples from a Postgres csvlog with log_min_duration_statement enabled
+    Lines other than statement durations are passed over; truncated rows are unusable
+    """
+    for row in csv.reader(f):
+        if len(row) <= CSVLOG_MESSAGE:
+            yield None
+            continue
+        match = DURATION_RE.match(row[CSVLOG_MESSAGE])
+        if match:
+            duration_ms, query = match.groups()
+            yield query.strip(), float(duration_ms) / 1000, None, parse_timestamp(row[CSVLOG_TIME])
+
+def parse_pg_stat_statements(f) -> Iterator[Optional[Sample]]:
+    """Yield one sample (the mean execution time) per pg_stat_statements row"""
+    reader = csv.DictReader(f)
+    mean_column = next((c for c in PGSS_MEAN_COLUMNS if c in (reader.fieldnames or [])), None)
+    if mean_column is None:
+        raise ValueError(f"pg_stat_statements export needs one of the columns {PGSS_MEAN_COLUMNS}")
+
+    for row in reader:
+        query = (row.get("query") or "").strip()
+        try:
+            mean = float(row.get(mean_column) or "")
+        except ValueError:
+            mean = None
+        yield (query, mean / 1000, None, None) if query and mean is not None else None
+
+def _jsonl_sample(line) -> Optional[Sample]:
+    """The sample of one JSON line, or None if it is malformed or incomplete"""
+    try:
+        record = json.loads(line)
+        query = record.get("query")
+        if "execution_time" in record:
+            execution_time = float(record["execution_time"])
+        elif "duration_ms" in record:
+            execution_time = float(record["duration_ms"]) / 1000
+        else:
+            return None
+        cpu_usage = record.get("cpu_usage")
+        cpu_usage = None if cpu_usage is None else float(cpu_usage)
+        timestamp = parse_timestamp(record.get("timestamp"))
+    except (ValueError, TypeError, AttributeError, OverflowError, OSError):
+        # Invalid JSON, a record that is not an object, a field of the wrong
+        # type or an epoch timestamp out of range
+        return None
+    if not isinstance(query, str) or not query.strip():
+        return None
+    return query.strip(), execution_time, cpu_usage, timestamp
+
+def parse_jsonl(f) -> Iterator[Optional[Sample]]:
+    """
+    Yield samples from JSON lines with 'query' and either 'execution_time'
+    (seconds) or 'duration_ms', plus optional 'cpu_usage' (CPU seconds) and 'timestamp'
+    """
+    for line in f:
+        if line.strip():
+            yield _jsonl_sample(line)
+
+PARSERS = {
+    "csvlog": parse_csvlog,
+    "pgss": parse_pg_stat_statements,
+    "jsonl": parse_jsonl,
+}
+
+def detect_format(path) -> str:
+    """Guess the log format from the file name and first line"""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".json")):
+        return "jsonl"
+    with open_log(path) as f:
+        header = next(csv.reader(f), [])
+    return "pgss" if "query" in header else "csvlog"
+
+# Normalized statements by digest of their text, least recently used first
+_normalized = OrderedDict()
+
+def _normalize(query):
+    """
+    Normalization is memoized per distinct text, since logs repeat statements
+    Entries are keyed on a digest so long texts are not held as keys, and only
+    the derived values are kept, not the parse tree
+    """
+    key = hashlib.blake2b(query.encode(), digest_size=16).digest()
+    if key in _normalized:
+        _normalized.move_to_end(key)
+        return _normalized[key]
+    analysis = QueryAnalysis.from_query(query)
+    value = analysis.group, analysis.normalized, list(analysis.structure)
+    if NORMALIZE_CACHE_SIZE > 0:
+        _normalized[key] = value
+        if len(_normalized) > NORMALIZE_CACHE_SIZE:
+            _normalized.popitem(last=False)
+    return value
+
+def _write_batch(samples):
+    """Write a batch of samples and any new fingerprints in one transaction"""
+    sample_rows = []
+    texts = []
+    groups = {}
+    group_samples = defaultdict(list)
+    for query, execution_time, cpu_usage, timestamp in samples:
+        query_group, normalized, structure = _normalize(query)
+        groups.setdefault(query_group, (normalized, structure))
+        timestamp = timestamp or datetime.now(timezone.utc)
+        group_samples[query_group].append((execution_time, cpu_usage, timestamp))
+        texts.append((query_group, query))
+        sample_rows.append({
+            "timestamp": to_epoch(timestamp),
+            "execution_time": execution_time,
+            "cpu_usage": cpu_usage,
+        })
+
+    with get_history_engine().begin() as conn:
+        text_ids = intern_texts(conn, texts)
+        for text, row in zip(texts, sample_rows):
+            row["text_id"] = text_ids[text]
+        known = set(conn.execute(
+            select(QueryFingerprintRecord.query_hash).where(
+                QueryFingerprintRecord.query_hash.in_(list(groups))
+            )
+        ).scalars())
+        records, bands = [], []
+        for query_group, (normalized, structure) in groups.items():
+            if query_group not in known:
+                record, record_bands = fingerprint_rows(query_group, normalized, structure)
+                records.append(record)
+                bands.extend(record_bands)
+
+        conn.execute(insert(QuerySample.__table__), sample_rows)
+        if records:
+            conn.execute(insert(QueryFingerprintRecord.__table__), records)
+            conn.execute(insert(QueryFingerprintBand.__table__), bands)
+
+        # Sketches are merged once per group and batch, in the same transaction
+        session = Session(bind=conn)
+        for query_group, samples in group_samples.items():
+            update_group_stats(session, query_group, samples)
+        session.flush()
+
+def import_log(path, log_format="auto", batch_size=BATCH_SIZE) -> Tuple[int, int]:
+    """
+    Stream a query log into the performance history
+    Memory use is bounded by batch_size. Rows the parser cannot use are
+    skipped, so one bad line never aborts an import whose earlier batches
+    are already committed. Returns the number of samples imported and of
+    rows skipped
+    """
+    if log_format == "auto":
+        log_format = detect_format(path)
+    parser = PARSERS[log_format]
+
+    imported = skipped = 0
+    batch = []
+    with open_log(path) as f:
+        for sample in parser(f):
+            if sample is None:
+                skipped += 1
+                continue
+            batch.append(sample)
+            if len(batch) >= batch_size:
+                _write_batch(batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            _write_batch(batch)
+            imported += len(batch)
+    maybe_apply_retention()
+    return imported, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Import query timings from logs into the performance history")
+    parser.add_argument("logs", nargs="+", help="Log files (.csv, .jsonl, optionally .gz)")
+    parser.add_argument("--format", choices=["auto", *PARSERS], default="auto",
+                        help="Log format (default: detect from file)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Samples written per transaction")
+    args = parser.parse_args()
+
+    for path in args.logs:
+        try:
+            count, skipped = import_log(path, args.format, args.batch_size)
+        except (OSError, ValueError) as e:
+            print(f"Error importing {path}: {e}", file=sys.stderr)
+            continue
+        print(f"Imported {count} samples from {path}" + (f" (skipped {skipped} unusable rows)" if skipped else ""))
+
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,778 @@
 import os
-from sqlalchemy import create_engine, text, Column, Float, String, DateTime
+import sys
+import time
+import hashlib
+import threading
+from sqlalchemy import (
+    create_engine, event, inspect, text, select, insert, update, delete, exists, case,
+    Column, Float, String, DateTime, Integer, LargeBinary, Text, Index, tuple_,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime, timezone
+from sqlalchemy.orm import sessionmaker, Session as BoundSession
+from datetime import datetime, timedelta, timezone
 import numpy as np
-from scorer.query_matcher import get_query_group, QuerySimilarity
-from db.config import DB_URL
+from scorer.sketch import QuantileSketch
+from scorer.query_matcher import (
+    QuerySimilarity, QueryFingerprint, QueryVectorizer, pack_signature, unpack_signature, pack_vector,
+    unpack_vector, get_query_group,
+)
+from scorer.query_analysis import QueryAnalysis
+from scorer.tracing import span
+from db.config import (
+    HISTORY_URL, DATA_DIR, HISTORY_RAW_RETENTION_DAYS, HISTORY_HOURLY_RETENTION_DAYS,
+    HISTORY_DAILY_RETENTION_DAYS,
+)
 
-# Ensure data directory exists
-data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-os.makedirs(data_dir, exist_ok=True)
-
-# Database setup
-engine = create_engine(DB_URL)
+# Database setup; the engine is created and the tables checked on first use
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
+Session = sessionmaker()
+_engine = None
+_engine_lock = threading.Lock()
 
-class QueryPerformance(Base):
-    __tablename__ = 'query_performance'
-    
-    id = Column(String, primary_key=True)
-    execution_time = Column(Float)
-    cpu_usage = Column(Float)
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    query_hash = Column(String)  # Hash of the query for grouping similar queries
-    query_text = Column(String)  # Store the original query text
-
-# Create tables
-Base.metadata.create_all(engine)
-
-def store_performance_metrics(execution_time, cpu_usage, query):
-    """Store performance metrics for a query"""
-    session = Session()
+class QueryText(Base):
+    __tablename__ = 'query_texts'
+
+    id = Column(Integer, primary_key=True)
+    text_hash = Column(String, unique=True, nullable=False)  # SHA-1 of query_hash and query_text
+    query_hash = Column(String, nullable=False, index=True)  # Query group (fingerprint) of the text
+    query_text = Column(Text, nullable=False)  # Stored once however often it runs
+
+class QuerySample(Base):
+    __tablename__ = 'query_samples'
+
+    id = Column(Integer, primary_key=True)
+    text_id = Column(Integer, nullable=False)  # QueryText.id
+    timestamp = Column(Float, nullable=False)  # Seconds since the epoch (UTC)
+    execution_time = Column(Float, nullable=False)
+    cpu_usage = Column(Float)  # CPU seconds; NULL for samples imported from logs
+
+    __table_args__ = (
+        # Recent samples of a group, and retention/recent-history scans
+        Index('ix_query_samples_text_id_timestamp', 'text_id', 'timestamp'),
+        Index('ix_query_samples_timestamp', 'timestamp'),
+    )
+
+class QueryFingerprintRecord(Base):
+    __tablename__ = 'query_fingerprints'
+
+    query_hash = Column(String, primary_key=True)  # Query group the fingerprint belongs to
+    normalized_text = Column(String)
+    structure = Column(String)  # Structure elements joined with '|'
+    signature = Column(LargeBinary)  # Packed MinHash signature
+    vector = Column(LargeBinary)  # Packed sparse n-gram/structure vector (see QueryVectorizer.sparse_vector)
+
+class QueryFingerprintBand(Base):
+    __tablename__ = 'query_fingerprint_bands'
+
+    # Composite primary key doubles as the (band, bucket) lookup index
+    band = Column(Integer, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    query_hash = Column(String, primary_key=True)
+
+class HistoryMetadata(Base):
+    __tablename__ = 'history_metadata'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+class QueryGroupStats(Base):
+    __tablename__ = 'query_group_stats'
+
+    query_hash = Column(String, primary_key=True)
+    window = Column(String, primary_key=True)  # 'all', 'hour' or 'day'
+    window_start = Column(DateTime, primary_key=True)  # Naive UTC start of a tumbling window
+    count = Column(Integer)
+    execution_time = Column(Text)  # Serialized QuantileSketch
+    cpu_usage = Column(Text)  # Serialized QuantileSketch
+
+# Tumbling windows kept per query group; 'all' is never rotated
+STATS_WINDOWS = {
+    "all": None,
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+ALL_TIME_START = datetime(1970, 1, 1)
+
+def _retention(days):
+    return timedelta(days=days) if days > 0 else None
+
+# How long raw samples and each window's rollups are kept (None: forever)
+RAW_RETENTION = _retention(HISTORY_RAW_RETENTION_DAYS)
+STATS_RETENTION = {
+    "all": None,
+    "hour": _retention(HISTORY_HOURLY_RETENTION_DAYS),
+    "day": _retention(HISTORY_DAILY_RETENTION_DAYS),
+}
+# Retention runs at most this often per process, deleting this many samples per transaction
+RETENTION_INTERVAL = 3600
+RETENTION_CHUNK = 50_000
+_last_retention = None
+_retention_lock = threading.Lock()
+
+# Samples before the history store had a text table
+LEGACY_TABLE = 'query_performance'
+MIGRATION_CHUNK = 10_000
+# Group keys used to be the normalized text and structure joined with '|';
+# digest keys are hex. The marker records that none of the old ones are left
+LEGACY_KEY_PATTERN = '%|%'
+GROUP_KEY_MARKER = ('group_key', 'digest')
+# CPU usage used to be stored as a percent of wall time; the marker records
+# that samples and rollups hold CPU seconds
+CPU_UNIT_MARKER = ('cpu_usage', 'seconds')
+
+# Rough SQLite figures for predicting time from a plan's estimated rows touched
+PLAN_BASE_SECONDS = 5e-5
+PLAN_SECONDS_PER_ROW = 2e-7
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: readers (thresholds) don't wait for writers (new samples);
+    # synchronous=NORMAL is durable across crashes of the process in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def prepare_history_engine(engine):
+    """Set up a history database: WAL journal, tables and migration of legacy samples"""
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    # First: the other migrations read and write fingerprints with their vector column
+    migrate_fingerprint_vectors(engine)
+    migrate_legacy_history(engine)
+    # After the legacy samples are moved: they hold percents too
+    migrate_cpu_seconds(engine)
+    migrate_group_keys(engine)
+    return engine
+
+def get_history_engine():
+    """Engine of the performance history, creating it and its tables on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            engine = prepare_history_engine(create_engine(HISTORY_URL))
+            Session.configure(bind=engine)
+            _engine = engine
+        return _engine
+
+def history_session():
+    """New session on the performance history"""
+    get_history_engine()
+    return Session()
+
+def to_epoch(timestamp):
+    """Seconds since the epoch of a datetime (naive datetimes are UTC)"""
+    return (_utc_naive(timestamp) - ALL_TIME_START).total_seconds()
+
+def from_epoch(seconds):
+    """Naive UTC datetime of a sample timestamp"""
+    return ALL_TIME_START + timedelta(seconds=seconds)
+
+def text_hash(query_group, query_text):
+    # Keyed by group too: a text regrouped by a newer normalizer gets its own row
+    return hashlib.sha1(f"{query_group}\0{query_text}".encode()).hexdigest()
+
+def intern_texts(conn, texts):
+    """
+    Ids of query texts in query_texts, inserting the ones not stored yet
+    texts are (query_group, query_text) pairs; returns {(query_group, query_text): id}
+    """
+    by_hash = {text_hash(*pair): pair for pair in texts}
+    hashes = list(by_hash)
+
+    def lookup(keys):
+        found = {}
+        # Stay below the bound parameter limit of older SQLite versions
+        for i in range(0, len(keys), 500):
+            found.update(conn.execute(
+                select(QueryText.text_hash, QueryText.id).where(QueryText.text_hash.in_(keys[i:i + 500]))
+            ).all())
+        return found
+
+    ids = lookup(hashes)
+    missing = [h for h in hashes if h not in ids]
+    if missing:
+        # Another writer may store the same text concurrently
+        if conn.dialect.name == "sqlite":
+            statement = sqlite.insert(QueryText).on_conflict_do_nothing(index_elements=["text_hash"])
+        elif conn.dialect.name == "postgresql":
+            statement = postgresql.insert(QueryText).on_conflict_do_nothing(index_elements=["text_hash"])
+        else:
+            statement = insert(QueryText)
+        conn.execute(statement, [
+            {"text_hash": h, "query_hash": by_hash[h][0], "query_text": by_hash[h][1]} for h in missing
+        ])
+        ids.update(lookup(missing))
+    return {by_hash[h]: text_id for h, text_id in ids.items()}
+
+def migrate_legacy_history(engine):
+    """
+    Move the samples of a legacy query_performance table (full text and a
+    string key per sample) into query_texts/query_samples and drop it.
+    Groups without rollups get them, so no history is lost to retention.
+    Returns the number of samples moved
+    """
+    if not inspect(engine).has_table(LEGACY_TABLE):
+        return 0
+
+    migrated = 0
+    with engine.begin() as conn:
+        session = BoundSession(bind=conn)
+        with_stats = set(conn.execute(select(QueryGroupStats.query_hash).distinct()).scalars())
+        result = conn.execution_options(stream_results=True).execute(text(
+            f"SELECT query_hash, query_text, execution_time, cpu_usage, timestamp FROM {LEGACY_TABLE}"
+        ))
+        for rows in result.partitions(MIGRATION_CHUNK):
+            text_ids = intern_texts(conn, [(row.query_hash, row.query_text) for row in rows])
+            samples, group_samples = [], {}
+            for row in rows:
+                timestamp = row.timestamp
+                if isinstance(timestamp, str):
+                    timestamp = datetime.fromisoformat(timestamp)
+                timestamp = _utc_naive(timestamp or datetime.now(timezone.utc))
+                samples.append({
+                    "text_id": text_ids[row.query_hash, row.query_text],
+                    "timestamp": to_epoch(timestamp),
+                    "execution_time": row.execution_time,
+                    "cpu_usage": row.cpu_usage,
+                })
+                if row.query_hash not in with_stats:
+                    group_samples.setdefault(row.query_hash, []).append(
+                        (row.execution_time, row.cpu_usage, timestamp)
+                    )
+            conn.execute(insert(QuerySample), samples)
+            for query_group, values in group_samples.items():
+                update_group_stats(session, query_group, values)
+            session.flush()
+            migrated += len(samples)
+        conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+    # stderr: --batch writes JSON lines to stdout
+    print(f"Migrated {migrated} samples from {LEGACY_TABLE}", file=sys.stderr)
+    return migrated
+
+def migrate_group_keys(engine):
+    """
+    Re-key query groups stored under legacy keys to group_key digests,
+    merging groups the new key puts together. Texts are re-keyed from their
+    own SQL; fingerprints and rollups from one of their group's texts, or
+    from the normalized text once all texts are pruned.
+    Returns the number of legacy groups re-keyed
+    """
+    key, value = GROUP_KEY_MARKER
+    with engine.begin() as conn:
+        if conn.execute(select(HistoryMetadata.value).where(HistoryMetadata.key == key)).scalar() == value:
+            return 0
+
+        new_keys = {}
+        legacy_texts = conn.execute(
+            select(QueryText.id, QueryText.query_hash, QueryText.query_text)
+            .where(QueryText.query_hash.like(LEGACY_KEY_PATTERN))
+        ).all()
+        for text_id, old_key, query_text in legacy_texts:
+            new_key = get_query_group(query_text)
+            new_keys.setdefault(old_key, new_key)
+            new_hash = text_hash(new_key, query_text)
+            duplicate = conn.execute(select(QueryText.id).where(QueryText.text_hash == new_hash)).scalar()
+            if duplicate is None:
+                conn.execute(update(QueryText).where(QueryText.id == text_id).values(
+                    query_hash=new_key, text_hash=new_hash
+                ))
+            else:
+                conn.execute(update(QuerySample).where(QuerySample.text_id == text_id).values(text_id=duplicate))
+                conn.execute(delete(QueryText).where(QueryText.id == text_id))
+
+        legacy_records = conn.execute(
+            select(QueryFingerprintRecord).where(QueryFingerprintRecord.query_hash.like(LEGACY_KEY_PATTERN))
+        ).all()
+        for record in legacy_records:
+            if record.query_hash not in new_keys:
+                new_keys[record.query_hash] = get_query_group(record.normalized_text)
+            new_key = new_keys[record.query_hash]
+            conn.execute(delete(QueryFingerprintBand).where(QueryFingerprintBand.query_hash == record.query_hash))
+            conn.execute(delete(QueryFingerprintRecord).where(QueryFingerprintRecord.query_hash == record.query_hash))
+            if conn.execute(select(QueryFingerprintRecord.query_hash).where(
+                QueryFingerprintRecord.query_hash == new_key
+            )).first() is None:
+                row, bands = fingerprint_rows(
+                    new_key, record.normalized_text, record.structure.split('|') if record.structure else [],
+                    unpack_signature(record.signature)
+                )
+                conn.execute(insert(QueryFingerprintRecord), [row])
+                conn.execute(insert(QueryFingerprintBand), bands)
+
+        session = BoundSession(bind=conn)
+        legacy_stats = session.query(QueryGroupStats).filter(
+            QueryGroupStats.query_hash.like(LEGACY_KEY_PATTERN)
+        ).all()
+        for stats in legacy_stats:
+            if stats.query_hash not in new_keys:
+                # Neither texts nor a fingerprint left: legacy keys start with
+                # the normalized text (cut short at a || operator)
+                new_keys[stats.query_hash] = get_query_group(stats.query_hash.split('|')[0])
+            new_key = new_keys[stats.query_hash]
+            merged = session.get(QueryGroupStats, (new_key, stats.window, stats.window_start))
+            if merged is None:
+                session.add(QueryGroupStats(
+                    query_hash=new_key, window=stats.window, window_start=stats.window_start,
+                    count=stats.count, execution_time=stats.execution_time, cpu_usage=stats.cpu_usage,
+                ))
+            else:
+                exec_sketch = QuantileSketch.from_json(merged.execution_time)
+                cpu_sketch = QuantileSketch.from_json(merged.cpu_usage)
+                exec_sketch.merge(QuantileSketch.from_json(stats.execution_time))
+                cpu_sketch.merge(QuantileSketch.from_json(stats.cpu_usage))
+                merged.count = exec_sketch.count
+                merged.execution_time = exec_sketch.to_json()
+                merged.cpu_usage = cpu_sketch.to_json()
+            session.delete(stats)
+            # Make the new row visible to session.get for the next legacy group
+            session.flush()
+
+        conn.execute(delete(HistoryMetadata).where(HistoryMetadata.key == key))
+        conn.execute(insert(HistoryMetadata), [{"key": key, "value": value}])
+    if new_keys:
+        print(f"Re-keyed {len(new_keys)} query groups", file=sys.stderr)
+    return len(new_keys)
+
+def migrate_cpu_seconds(engine):
+    """
+    Convert CPU usage stored as a percent of wall time to CPU seconds.
+    Samples convert exactly; rollup CPU sketches are rebuilt from the
+    samples still in their window, so windows whose samples were pruned
+    keep no CPU figure and score against the default threshold.
+    Returns the number of samples converted
+    """
+    key, value = CPU_UNIT_MARKER
+    with engine.begin() as conn:
+        if conn.execute(select(HistoryMetadata.value).where(HistoryMetadata.key == key)).scalar() == value:
+            return 0
+
+        converted = conn.execute(
+            update(QuerySample).where(QuerySample.cpu_usage.is_not(None)).values(cpu_usage=case(
+                (QuerySample.cpu_usage > 0, QuerySample.cpu_usage / 100.0 * QuerySample.execution_time),
+                else_=0.0,
+            ))
+        ).rowcount
+
+        session = BoundSession(bind=conn)
+        for stats in session.query(QueryGroupStats):
+            samples = select(QuerySample.cpu_usage).join(
+                QueryText, QueryText.id == QuerySample.text_id
+            ).where(QueryText.query_hash == stats.query_hash)
+            duration = STATS_WINDOWS[stats.window]
+            if duration is not None:
+                samples = samples.where(
+                    QuerySample.timestamp >= to_epoch(stats.window_start),
+                    QuerySample.timestamp < to_epoch(stats.window_start + duration),
+                )
+            cpu_sketch = QuantileSketch()
+            cpu_sketch.add_all(conn.execute(samples).scalars())
+            stats.cpu_usage = cpu_sketch.to_json()
+        session.flush()
+
+        conn.execute(delete(HistoryMetadata).where(HistoryMetadata.key == key))
+        conn.execute(insert(HistoryMetadata), [{"key": key, "value": value}])
+    if converted:
+        print(f"Converted the CPU usage of {converted} samples to seconds", file=sys.stderr)
+    return converted
+
+def migrate_fingerprint_vectors(engine):
+    """
+    Add the vector column to fingerprints written before it existed and
+    fill it in, so similarity lookups never vectorize stored texts.
+    Returns the number of fingerprints vectorized
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns(QueryFingerprintRecord.__tablename__)}
+    with engine.begin() as conn:
+        if "vector" not in columns:
+            column_type = LargeBinary().compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {QueryFingerprintRecord.__tablename__} ADD COLUMN vector {column_type}"))
+        missing = conn.execute(
+            select(QueryFingerprintRecord.query_hash, QueryFingerprintRecord.normalized_text,
+                   QueryFingerprintRecord.structure)
+            .where(QueryFingerprintRecord.vector.is_(None))
+        ).all()
+        for query_group, normalized, structure in missing:
+            vector = QueryVectorizer.sparse_vector(normalized, structure.split('|') if structure else [])
+            conn.execute(update(QueryFingerprintRecord).where(
+                QueryFingerprintRecord.query_hash == query_group
+            ).values(vector=pack_vector(vector)))
+    if missing:
+        # stderr: --batch writes JSON lines to stdout
+        print(f"Vectorized {len(missing)} query fingerprints", file=sys.stderr)
+    return len(missing)
+
+def fingerprint_rows(query_group, normalized, structure, signature=None, vector=None):
+    """Build the fingerprint row and LSH bucket rows of a query group"""
+    if signature is None:
+        signature = QueryFingerprint.signature(normalized, structure)
+    if vector is None:
+        vector = QueryVectorizer.sparse_vector(normalized, structure)
+    record = {
+        "query_hash": query_group,
+        "normalized_text": normalized,
+        "structure": '|'.join(structure),
+        "signature": pack_signature(signature),
+        "vector": pack_vector(vector),
+    }
+    bands = [
+        {"band": band, "bucket": bucket, "query_hash": query_group}
+        for band, bucket in QueryFingerprint.band_keys(signature)
+    ]
+    return record, bands
+
+def register_fingerprint(session, query_group, normalized, structure, signature=None, vector=None):
+    """Persist the fingerprint and LSH buckets of a query group once"""
+    if session.get(QueryFingerprintRecord, query_group) is not None:
+        return
+
+    record, bands = fingerprint_rows(query_group, normalized, structure, signature, vector)
+    session.add(QueryFingerprintRecord(**record))
+    for band in bands:
+        session.add(QueryFingerprintBand(**band))
+
+def store_performance_metrics(execution_time, cpu_usage, analysis):
+    """Store performance metrics for a query (QueryAnalysis or SQL text)"""
+    analysis = QueryAnalysis.of(analysis)
+    session = history_session()
     try:
-        query_group = get_query_group(query)
-        performance = QueryPerformance(
-            id=f"{query_group}_{datetime.now(timezone.utc).timestamp()}",
+        query_group = analysis.group
+        register_fingerprint(
+            session, query_group, analysis.normalized, list(analysis.structure), analysis.signature,
+            analysis.vector
+        )
+        now = datetime.now(timezone.utc)
+        text = (query_group, analysis.query)
+        text_id = intern_texts(session.connection(), [text])[text]
+        session.add(QuerySample(
+            text_id=text_id,
+            timestamp=to_epoch(now),
             execution_time=execution_time,
             cpu_usage=cpu_usage,
-            query_hash=query_group,
-            query_text=query
+        ))
+        update_group_stats(session, query_group, [(execution_time, cpu_usage, now)], now=now)
+        session.commit()
+    finally:
+        session.close()
+    maybe_apply_retention()
+
+def apply_retention(now=None):
+    """
+    Enforce the retention policy: raw samples past RAW_RETENTION are
+    deleted (their hourly and daily rollups were written with them),
+    rollups past their window's retention too, then texts no sample uses.
+    Returns the number of samples deleted
+    """
+    now = _utc_naive(now or datetime.now(timezone.utc))
+    engine = get_history_engine()
+    deleted = 0
+    if RAW_RETENTION is not None:
+        cutoff = to_epoch(now - RAW_RETENTION)
+        # Chunked so a large backlog never holds the write lock for long
+        while True:
+            expired = select(QuerySample.id).where(QuerySample.timestamp < cutoff).limit(RETENTION_CHUNK)
+            with engine.begin() as conn:
+                count = conn.execute(delete(QuerySample).where(QuerySample.id.in_(expired))).rowcount
+            deleted += count
+            if count < RETENTION_CHUNK:
+                break
+
+    with engine.begin() as conn:
+        for window in STATS_WINDOWS:
+            oldest = oldest_window_start(window, now)
+            if oldest is not None:
+                conn.execute(delete(QueryGroupStats).where(
+                    QueryGroupStats.window == window, QueryGroupStats.window_start < oldest
+                ))
+        conn.execute(delete(QueryText).where(~exists().where(QuerySample.text_id == QueryText.id)))
+    return deleted
+
+def maybe_apply_retention():
+    """Run apply_retention if this process has not for RETENTION_INTERVAL seconds"""
+    global _last_retention
+    if not _retention_lock.acquire(blocking=False):
+        # Already running in another thread
+        return
+    try:
+        if _last_retention is not None and time.monotonic() - _last_retention < RETENTION_INTERVAL:
+            return
+        _last_retention = time.monotonic()
+        apply_retention()
+    finally:
+        _retention_lock.release()
+
+def _utc_naive(timestamp):
+    """Convert a timestamp to naive UTC, the form DateTime columns hold in SQLite"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def window_start(window, timestamp):
+    """Start of the tumbling window containing timestamp"""
+    duration = STATS_WINDOWS[window]
+    if duration is None:
+        return ALL_TIME_START
+    seconds = int(duration.total_seconds())
+    epoch_seconds = int((_utc_naive(timestamp) - ALL_TIME_START).total_seconds())
+    return ALL_TIME_START + timedelta(seconds=epoch_seconds - epoch_seconds % seconds)
+
+def oldest_window_start(window, now):
+    """Start of the oldest window whose rollup is kept, or None if all are"""
+    retention = STATS_RETENTION[window]
+    if retention is None:
+        return None
+    return window_start(window, now - retention)
+
+def update_group_stats(session, query_group, samples, now=None):
+    """
+    Fold (execution_time, cpu_usage, timestamp) samples into the running
+    sketches of a query group. Windowed sketches past their retention
+    (STATS_RETENTION) are dropped, so storage per group stays bounded.
+    """
+    now = _utc_naive(now or datetime.now(timezone.utc))
+    oldest = {window: oldest_window_start(window, now) for window in STATS_WINDOWS}
+    pending = {}
+    for execution_time, cpu_usage, timestamp in samples:
+        for window in STATS_WINDOWS:
+            start = window_start(window, timestamp or now)
+            if oldest[window] is not None and start < oldest[window]:
+                continue
+            exec_sketch, cpu_sketch = pending.setdefault(
+                (window, start), (QuantileSketch(), QuantileSketch())
+            )
+            exec_sketch.add(execution_time)
+            cpu_sketch.add(cpu_usage)
+
+    for (window, start), (exec_sketch, cpu_sketch) in pending.items():
+        stats = session.get(QueryGroupStats, (query_group, window, start))
+        if stats is None:
+            stats = QueryGroupStats(query_hash=query_group, window=window, window_start=start)
+            session.add(stats)
+        else:
+            exec_sketch.merge(QuantileSketch.from_json(stats.execution_time))
+            cpu_sketch.merge(QuantileSketch.from_json(stats.cpu_usage))
+        stats.count = exec_sketch.count
+        stats.execution_time = exec_sketch.to_json()
+        stats.cpu_usage = cpu_sketch.to_json()
+
+    for window in STATS_WINDOWS:
+        if oldest[window] is not None:
+            session.query(QueryGroupStats).filter(
+                QueryGroupStats.query_hash == query_group,
+                QueryGroupStats.window == window,
+                QueryGroupStats.window_start < oldest[window]
+            ).delete(synchronize_session=False)
+
+def group_percentiles(session, query_groups, percentile=95, window="all", now=None):
+    """
+    Merge the sketches of the given query groups and return the
+    (execution_time, cpu_usage) percentiles, or None if no stats exist.
+    Windowed lookups cover the current and the previous window.
+    """
+    stats_query = session.query(QueryGroupStats).filter(
+        QueryGroupStats.query_hash.in_(query_groups),
+        QueryGroupStats.window == window
+    )
+    duration = STATS_WINDOWS[window]
+    if duration is not None:
+        now = _utc_naive(now or datetime.now(timezone.utc))
+        stats_query = stats_query.filter(
+            QueryGroupStats.window_start >= window_start(window, now) - duration
         )
-        session.add(performance)
+
+    exec_sketch, cpu_sketch = QuantileSketch(), QuantileSketch()
+    for stats in stats_query:
+        exec_sketch.merge(QuantileSketch.from_json(stats.execution_time))
+        cpu_sketch.merge(QuantileSketch.from_json(stats.cpu_usage))
+    if exec_sketch.count == 0:
+        return None
+
+    q = percentile / 100
+    return exec_sketch.quantile(q), cpu_sketch.quantile(q)
+
+def rebuild_group_stats():
+    """
+    Rebuild all group sketches from the raw performance history
+    Samples already past RAW_RETENTION are gone, so with retention enabled
+    the rebuilt sketches only cover the retained samples
+    """
+    session = history_session()
+    try:
+        session.query(QueryGroupStats).delete()
+        groups = [g for (g,) in session.query(QueryText.query_hash).distinct()]
+        for query_group in groups:
+            samples = session.query(
+                QuerySample.execution_time, QuerySample.cpu_usage, QuerySample.timestamp
+            ).join(QueryText, QueryText.id == QuerySample.text_id).filter(QueryText.query_hash == query_group)
+            update_group_stats(session, query_group, [
+                (execution_time, cpu_usage, from_epoch(timestamp))
+                for execution_time, cpu_usage, timestamp in samples
+            ])
         session.commit()
     finally:
         session.close()
 
-def find_similar_queries(query, session, threshold=0.8):
-    """Find similar queries in the database"""
-    query_group = get_query_group(query)
-    recent_queries = session.query(QueryPerformance).order_by(
-        QueryPerformance.timestamp.desc()
-    ).limit(1000).all()
-    
-    similar_queries = []
-    for q in recent_queries:
-        similarity = QuerySimilarity.calculate_similarity(query, q.query_text)
-        if similarity >= threshold:
-            similar_queries.append(q)
-    
-    return similar_queries
+def backfill_fingerprints():
+    """Fingerprint query groups stored before the fingerprint index existed"""
+    session = history_session()
+    try:
+        indexed = session.query(QueryFingerprintRecord.query_hash)
+        missing = session.query(
+            QueryText.query_hash, QueryText.query_text
+        ).filter(~QueryText.query_hash.in_(indexed)).group_by(QueryText.query_hash)
+
+        for query_group, query_text in missing:
+            analysis = QueryAnalysis.from_query(query_text)
+            register_fingerprint(
+                session, query_group, analysis.normalized, list(analysis.structure), analysis.signature,
+                analysis.vector
+            )
+        session.commit()
+    finally:
+        session.close()
+
+def find_similar_groups(analysis, session, threshold=0.8):
+    """Find query groups similar to a query (QueryAnalysis or SQL text) using the fingerprint index"""
+    analysis = QueryAnalysis.of(analysis)
+    with span("similarity"):
+        # Candidate groups share at least one LSH bucket with the query
+        candidates = session.query(QueryFingerprintRecord).filter(
+            QueryFingerprintRecord.query_hash.in_(
+                session.query(QueryFingerprintBand.query_hash).filter(
+                    tuple_(QueryFingerprintBand.band, QueryFingerprintBand.bucket).in_(
+                        analysis.band_keys
+                    )
+                )
+            )
+        ).all()
 
-def calculate_dynamic_thresholds(query=None, window_size=100):
+        # Candidates are compared by their stored vectors, without tokenizing their text again
+        similarities = QuerySimilarity.sparse_similarity(analysis.normalized, list(analysis.structure), [
+            unpack_vector(c.vector) if c.vector is not None
+            else QueryVectorizer.sparse_vector(c.normalized_text, c.structure.split('|') if c.structure else [])
+            for c in candidates
+        ])
+    return [
+        c.query_hash for c, similarity in zip(candidates, similarities)
+        if similarity >= threshold
+    ]
+
+def recent_samples(session, query_groups=None, limit=1000):
+    """
+    Most recent raw samples, of the given query groups or of all queries
+    Rows have query_hash, query_text, execution_time, cpu_usage and timestamp (epoch seconds)
+    """
+    samples = session.query(
+        QueryText.query_hash, QueryText.query_text,
+        QuerySample.execution_time, QuerySample.cpu_usage, QuerySample.timestamp
+    ).join(QueryText, QueryText.id == QuerySample.text_id)
+    if query_groups is not None:
+        # Filter on text ids so the (text_id, timestamp) index is used
+        # rather than walking the whole timestamp index
+        samples = samples.filter(QuerySample.text_id.in_(
+            select(QueryText.id).where(QueryText.query_hash.in_(query_groups))
+        ))
+    return samples.order_by(QuerySample.timestamp.desc()).limit(limit).all()
+
+def find_similar_queries(analysis, session, threshold=0.8, limit=1000):
+    """Find similar queries in the database using the fingerprint index"""
+    similar_groups = find_similar_groups(analysis, session, threshold)
+    if not similar_groups:
+        return []
+    return recent_samples(session, similar_groups, limit)
+
+# (execution time, CPU usage) thresholds in seconds without history to derive them from
+DEFAULT_THRESHOLDS = (1.0, 1.0)
+
+def calculate_dynamic_thresholds(analysis=None, window_size=100, window="all"):
     """
     Calculate dynamic thresholds based on historical data
-    If query is provided, thresholds are calculated for similar queries
+    If a query (QueryAnalysis or SQL text) is provided, thresholds are calculated for similar queries
+    from their per-group sketches; window ('all', 'hour', 'day') restricts
+    them to recent samples so thresholds follow workload drift
     """
-    session = Session()
+    session = history_session()
     try:
-        if query:
-            # Find similar queries
-            similar_queries = find_similar_queries(query, session)
+        if analysis:
+            similar_groups = find_similar_groups(analysis, session)
+            if not similar_groups:
+                return DEFAULT_THRESHOLDS
+
+            percentiles = group_percentiles(session, similar_groups, 95, window)
+            if percentiles is not None:
+                exec_threshold, cpu_threshold = percentiles
+                return exec_threshold, DEFAULT_THRESHOLDS[1] if cpu_threshold is None else cpu_threshold
+
+            # No rollup covers the window: fall back to raw rows
+            similar_queries = recent_samples(session, similar_groups)
             if not similar_queries:
-                return 1.0, 100.0
+                return DEFAULT_THRESHOLDS
             
             # Use similar queries for threshold calculation
             exec_times = [q.execution_time for q in similar_queries]
-            cpu_usages = [q.cpu_usage for q in similar_queries]
+            cpu_usages = [q.cpu_usage for q in similar_queries if q.cpu_usage is not None]
         else:
             # Get recent performance data
-            recent_data = session.query(QueryPerformance).order_by(
-                QueryPerformance.timestamp.desc()
-            ).limit(window_size).all()
+            recent_data = recent_samples(session, limit=window_size)
             
             if not recent_data:
-                return 1.0, 100.0
+                return DEFAULT_THRESHOLDS
             
             exec_times = [p.execution_time for p in recent_data]
-            cpu_usages = [p.cpu_usage for p in recent_data]
+            cpu_usages = [p.cpu_usage for p in recent_data if p.cpu_usage is not None]
         
         # Calculate 95th percentile for thresholds
+        # (imported log samples carry no CPU reading)
         exec_threshold = np.percentile(exec_times, 95)
-        cpu_threshold = np.percentile(cpu_usages, 95)
+        cpu_threshold = np.percentile(cpu_usages, 95) if cpu_usages else DEFAULT_THRESHOLDS[1]
         
         return float(exec_threshold), float(cpu_threshold)
     finally:
         session.close()
 
-def calculate_performance_score(execution_time, cpu_usage, query=None):
+def predict_performance(analysis, plan_cost=None):
+    """
+    Predict execution time and CPU usage of a query without running it
+    Uses the median of similar query groups' history, falling back to the
+    EXPLAIN cost estimate (rows touched). Returns a dict with the figures
+    and the source of the prediction ('history', 'plan' or None)
+    """
+    session = history_session()
+    try:
+        similar_groups = find_similar_groups(analysis, session)
+        medians = group_percentiles(session, similar_groups, 50) if similar_groups else None
+    finally:
+        session.close()
+
+    if medians is not None:
+        execution_time, cpu_usage = medians
+        return {"execution_time": execution_time, "cpu_usage": cpu_usage,
+                "source": "history", "similar_groups": len(similar_groups)}
+    if plan_cost is not None:
+        return {"execution_time": PLAN_BASE_SECONDS + plan_cost * PLAN_SECONDS_PER_ROW,
+                "cpu_usage": None, "source": "plan", "similar_groups": 0}
+    return {"execution_time": None, "cpu_usage": None, "source": None, "similar_groups": 0}
+
+def calculate_performance_score(execution_time, cpu_usage, analysis=None, window="all"):
     """
     Calculate performance score using dynamic thresholds
     Returns a score between 0 and 50
     """
-    exec_threshold, cpu_threshold = calculate_dynamic_thresholds(query)
+    exec_threshold, cpu_threshold = calculate_dynamic_thresholds(analysis, window=window)
     
-    exec_score = max(0, 25 * (1 - (execution_time / exec_threshold)))
-    cpu_score = max(0, 25 * (1 - (cpu_usage / cpu_threshold)))
+    exec_score = threshold_score(execution_time, exec_threshold)
+    if cpu_usage is None:
+        # No CPU figure (e.g. predicted from imported logs): weigh execution time alone
+        return 2 * exec_score
+    cpu_score = threshold_score(cpu_usage, cpu_threshold)
     
-    return exec_score + cpu_score 
\ No newline at end of file
+    return exec_score + cpu_score
+
+def threshold_score(value, threshold, max_score=25):
+    """Score a metric against its threshold, linearly from max_score down to 0"""
+    if threshold <= 0:
+        # History of zero readings: only another zero reading is within budget
+        return max_score if value <= 0 else 0
+    return max(0, max_score * (1 - (value / threshold))) 
\ No newline at end of file
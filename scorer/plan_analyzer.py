@@ -0,0 +1,370 @@
+import re
+import math
+from typing import Dict, List, Optional, Tuple
+from sqlparse.sql import Identifier, TokenList
+
+# Row count assumed for tables without statistics
+DEFAULT_TABLE_ROWS = 1000
+# Rows per key assumed for index lookups without statistics (SQLite's own default)
+DEFAULT_ROWS_PER_KEY = 10
+# Fraction of a table a range lookup (<, >, BETWEEN) is assumed to return
+RANGE_SELECTIVITY = 0.25
+
+_OBJECT_RE = re.compile(r"^(?:SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+(\S+))?", re.IGNORECASE)
+_INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\S+)", re.IGNORECASE)
+_MATERIALIZE_RE = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE)\s+(\S+)", re.IGNORECASE)
+
+class PlanNode:
+    """One node of a query plan (a row of SQLite's EXPLAIN QUERY PLAN output)"""
+
+    def __init__(self, node_id, parent_id, detail, operation=None, info=None):
+        self.id = node_id
+        self.parent_id = parent_id
+        self.detail = detail
+        self.children: List["PlanNode"] = []
+        self.table: Optional[str] = None
+        self.estimated_rows = 0.0
+        self.cost = 0.0
+        # Set for PostgreSQL and DuckDB nodes, whose JSON plans name the operation
+        self._operation = operation
+        self.info = info or {}
+
+    @property
+    def operation(self) -> str:
+        if self._operation is not None:
+            return self._operation
+        detail = self.detail.upper()
+        for prefix, operation in (
+            ("SCAN", "scan"),
+            ("SEARCH", "search"),
+            ("USE TEMP B-TREE", "temp_btree"),
+            ("CORRELATED", "correlated_subquery"),
+            ("SCALAR SUBQUERY", "subquery"),
+            ("LIST SUBQUERY", "subquery"),
+            ("MATERIALIZE", "materialize"),
+            ("CO-ROUTINE", "materialize"),
+            ("COMPOUND QUERY", "compound"),
+            ("MULTI-INDEX OR", "compound"),
+        ):
+            if detail.startswith(prefix):
+                return operation
+        return "block"
+
+    def __repr__(self):
+        return f"PlanNode({self.id}, {self.detail!r}, rows={self.estimated_rows:.0f}, cost={self.cost:.0f})"
+
+def build_plan_tree(plan_rows) -> List[PlanNode]:
+    """Build the plan tree from (id, parent, notused, detail) rows; returns the top-level nodes"""
+    nodes = {}
+    roots = []
+    for row in plan_rows:
+        node = PlanNode(row[0], row[1], row[3])
+        nodes[node.id] = node
+        parent = nodes.get(node.parent_id)
+        if parent is None:
+            roots.append(node)
+        else:
+            parent.children.append(node)
+    return roots
+
+def table_aliases(statement) -> Dict[str, str]:
+    """Map table aliases used in a parsed statement to the real table names"""
+    aliases = {}
+
+    def walk(token_list):
+        for token in token_list.tokens:
+            if isinstance(token, Identifier):
+                alias, real_name = token.get_alias(), token.get_real_name()
+                if alias and real_name and alias != real_name:
+                    aliases.setdefault(alias, real_name)
+            if isinstance(token, TokenList):
+                walk(token)
+
+    if statement is not None:
+        walk(statement)
+    return aliases
+
+class PlanCostModel:
+    """
+    Estimates the rows touched by a plan
+    Sibling SCAN/SEARCH nodes are nested loops, so each runs once per row
+    produced by the loops before it. Table sizes come from sqlite_stat1 or
+    rowid bounds (see db.database.get_table_stats).
+    """
+
+    def __init__(self, table_rows=None, index_rows_per_key=None, aliases=None):
+        self.table_rows = table_rows or {}
+        self.index_rows_per_key = index_rows_per_key or {}
+        self.aliases = aliases or {}
+        self.materialized: Dict[str, float] = {}
+
+    def rows_of(self, name: str) -> Tuple[Optional[str], float]:
+        """Resolve a plan object name to (table, row count)"""
+        name = name.strip('"`[]')
+        if name in self.materialized:
+            return name, self.materialized[name]
+        table = self.aliases.get(name, name)
+        if table in self.materialized:
+            return table, self.materialized[table]
+        return table, float(self.table_rows.get(table, DEFAULT_TABLE_ROWS))
+
+    def estimate(self, nodes: List[PlanNode]) -> Tuple[float, float]:
+        """Estimate (rows produced, cost) of sibling nodes forming one loop nest"""
+        loop_rows = 1.0
+        cost = 0.0
+        for node in nodes:
+            operation = node.operation
+            if operation in ("scan", "search"):
+                node.table, table_rows = self._object(node)
+                per_loop_rows, per_loop_cost = self._access(node, operation, table_rows)
+                node.estimated_rows = per_loop_rows
+                node.cost = loop_rows * per_loop_cost
+                loop_rows *= max(per_loop_rows, 1.0)
+            elif operation == "temp_btree":
+                node.estimated_rows = loop_rows
+                node.cost = loop_rows * math.log2(loop_rows + 1)
+            elif operation == "correlated_subquery":
+                rows, child_cost = self.estimate(node.children)
+                node.estimated_rows = rows
+                # Re-evaluated for every outer row
+                node.cost = loop_rows * child_cost
+            elif operation == "materialize":
+                rows, child_cost = self.estimate(node.children)
+                match = _MATERIALIZE_RE.match(node.detail)
+                if match:
+                    self.materialized[match.group(1)] = rows
+                node.estimated_rows = rows
+                node.cost = child_cost
+            elif operation == "compound":
+                # Each branch is evaluated independently
+                rows, branch_cost = 0.0, 0.0
+                for child in node.children:
+                    child_rows, child_cost = self.estimate([child])
+                    rows += child_rows
+                    branch_cost += child_cost
+                node.estimated_rows = rows
+                node.cost = branch_cost
+                loop_rows *= max(rows, 1.0)
+            elif operation == "subquery":
+                # Uncorrelated subqueries run once and don't multiply the loop
+                rows, child_cost = self.estimate(node.children)
+                node.estimated_rows = rows
+                node.cost = child_cost
+            else:
+                # Compound branches and other groupings produce their children's rows
+                rows, child_cost = self.estimate(node.children)
+                node.estimated_rows = rows
+                node.cost = child_cost
+                loop_rows *= max(rows, 1.0)
+            cost += node.cost
+        return loop_rows, cost
+
+    def _object(self, node: PlanNode) -> Tuple[Optional[str], float]:
+        match = _OBJECT_RE.match(node.detail)
+        if not match:
+            return None, float(DEFAULT_TABLE_ROWS)
+        table, table_rows = self.rows_of(match.group(1))
+        if match.group(2):
+            # Older SQLite: 'SCAN TABLE users AS u'
+            self.aliases.setdefault(match.group(2), table)
+        return table, table_rows
+
+    def _access(self, node: PlanNode, operation: str, table_rows: float) -> Tuple[float, float]:
+        """(rows returned, cost) of one execution of a SCAN/SEARCH node"""
+        detail = node.detail.upper()
+        if operation == "scan":
+            # Covering index scans read narrower pages than the table itself
+            factor = 0.5 if "COVERING INDEX" in detail else 1.0
+            return table_rows, table_rows * factor
+
+        lookup_cost = math.log2(table_rows + 1) + 1
+        if "INTEGER PRIMARY KEY" in detail and "=" in detail and not _is_range(detail):
+            return 1.0, lookup_cost
+        if _is_range(detail):
+            rows = max(1.0, table_rows * RANGE_SELECTIVITY)
+            return rows, lookup_cost + rows
+
+        index = _INDEX_RE.search(node.detail)
+        rows_per_key = self.index_rows_per_key.get(index.group(1)) if index else None
+        rows = float(rows_per_key or min(DEFAULT_ROWS_PER_KEY, table_rows))
+        cost = lookup_cost + rows
+        if "AUTOMATIC" in detail:
+            # The temporary index is built once per statement, amortized over the loop
+            cost += math.log2(table_rows + 1)
+        return rows, cost
+
+def _is_range(detail: str) -> bool:
+    return any(op in detail for op in ("<", ">", "BETWEEN"))
+
+def analyze_plan(plan_rows, table_rows=None, index_rows_per_key=None, statement=None):
+    """
+    Build and cost the plan tree
+    Returns (estimated cost in rows touched, estimated result rows, top-level nodes)
+    """
+    roots = build_plan_tree(plan_rows)
+    model = PlanCostModel(table_rows, index_rows_per_key, table_aliases(statement))
+    rows, cost = model.estimate(roots)
+    return cost, rows, roots
+
+_POSTGRES_OPERATIONS = {
+    "Seq Scan": "scan",
+    "Sample Scan": "scan",
+    "Index Scan": "search",
+    "Index Only Scan": "search",
+    "Bitmap Index Scan": "search",
+    "Bitmap Heap Scan": "search",
+    "Sort": "sort",
+    "Incremental Sort": "sort",
+    "Materialize": "materialize",
+}
+
+def build_postgres_tree(plan) -> List[PlanNode]:
+    """Build the plan tree from PostgreSQL's EXPLAIN (FORMAT JSON) output"""
+    counter = iter(range(1 << 30))
+
+    def build(info, parent_id):
+        relationship = info.get("Parent Relationship")
+        if relationship == "SubPlan":
+            # Re-run for every row of the node it belongs to
+            operation = "correlated_subquery"
+        elif relationship == "InitPlan":
+            operation = "subquery"
+        else:
+            operation = _POSTGRES_OPERATIONS.get(info["Node Type"], "block")
+
+        detail = info["Node Type"]
+        if "Index Name" in info:
+            detail += f" using {info['Index Name']}"
+        if "Relation Name" in info:
+            detail += f" on {info['Relation Name']}"
+            if info.get("Alias", info["Relation Name"]) != info["Relation Name"]:
+                detail += f" {info['Alias']}"
+        if "Sort Key" in info:
+            detail += f" by {', '.join(info['Sort Key'])}"
+        if info.get("Sort Space Type") == "Disk":
+            detail += " (spilled to disk)"
+
+        node = PlanNode(next(counter), parent_id, detail, operation, info)
+        node.table = info.get("Relation Name")
+        node.children = [build(child, node.id) for child in info.get("Plans", [])]
+        return node
+
+    return [build(plan["Plan"], None)] if plan and "Plan" in plan else []
+
+def _postgres_cost(node: PlanNode, loops: float, table_rows) -> float:
+    """
+    Rows touched by a PostgreSQL plan node and its children
+    EXPLAIN ANALYZE plans give actual rows and loops, including the rows
+    scans read and filtered out. Estimated plans get loops from nested
+    loop joins and full-table reads for sequential scans.
+    """
+    info = node.info
+    analyzed = "Actual Loops" in info
+    if analyzed:
+        node_loops = info["Actual Loops"]
+        node.estimated_rows = info["Actual Rows"] * node_loops
+        read = (info["Actual Rows"] + info.get("Rows Removed by Filter", 0)
+                + info.get("Rows Removed by Index Recheck", 0)) * node_loops
+    else:
+        node_loops = loops
+        node.estimated_rows = info["Plan Rows"] * loops
+        read = node.estimated_rows
+        if node.operation == "scan" and node.table:
+            read = table_rows.get(node.table, info["Plan Rows"]) * loops
+
+    # Index-only lookups (e.g. Bitmap Index Scan) are paid for by the heap node
+    node.cost = read if node.table and node.operation in ("scan", "search") else 0.0
+
+    child_loops = [node_loops] * len(node.children)
+    if not analyzed and info["Node Type"] == "Nested Loop" and len(node.children) == 2:
+        child_loops[1] = loops * max(node.children[0].info["Plan Rows"], 1.0)
+    return node.cost + sum(
+        _postgres_cost(child, child_loop, table_rows)
+        for child, child_loop in zip(node.children, child_loops)
+    )
+
+def analyze_postgres_plan(plan, table_rows=None):
+    """Returns (rows touched, result rows, top-level nodes) of a PostgreSQL plan"""
+    roots = build_postgres_tree(plan)
+    if not roots:
+        return 0.0, 0.0, roots
+    cost = _postgres_cost(roots[0], 1.0, table_rows or {})
+    return cost, roots[0].estimated_rows, roots
+
+def _duckdb_operation(name: str) -> str:
+    if "INDEX_SCAN" in name:
+        return "search"
+    if name in ("SEQ_SCAN", "TABLE_SCAN"):
+        return "scan"
+    if name in ("ORDER_BY", "TOP_N"):
+        return "sort"
+    return "block"
+
+def build_duckdb_tree(plan) -> List[PlanNode]:
+    """Build the plan tree from DuckDB's EXPLAIN (FORMAT JSON) output"""
+    counter = iter(range(1 << 30))
+
+    def build(info, parent_id):
+        name = info.get("name", "").strip()
+        extra = info.get("extra_info") or {}
+        table = extra.get("Table")
+        node = PlanNode(
+            next(counter), parent_id, f"{name} {table.split('.')[-1]}" if table else name,
+            _duckdb_operation(name), info
+        )
+        node.table = table.split(".")[-1] if table else None
+        cardinality = re.search(r"\d+", str(extra.get("Estimated Cardinality", "")))
+        node.children = [build(child, node.id) for child in info.get("children", [])]
+        node.estimated_rows = float(cardinality.group()) if cardinality else 0.0
+        if node.estimated_rows == 0 and node.children:
+            # Operators without an estimate (ORDER_BY, or 0 on some projections) pass their input through
+            node.estimated_rows = node.children[0].estimated_rows
+        return node
+
+    return [build(root, None) for root in plan or []]
+
+def analyze_duckdb_plan(plan, table_rows=None):
+    """
+    Returns (rows touched, result rows, top-level nodes) of a DuckDB plan
+    Scans read their whole table (less with filter pushdown, which the
+    estimate ignores); nested loop joins and cross products compare every
+    pair of input rows.
+    """
+    table_rows = table_rows or {}
+    roots = build_duckdb_tree(plan)
+    cost = 0.0
+    for node in walk_plan(roots):
+        name = node.info.get("name", "").strip()
+        if node.operation == "scan":
+            node.cost = float(table_rows.get(node.table, node.estimated_rows))
+        elif node.operation == "search":
+            node.cost = node.estimated_rows
+        elif name in ("NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN", "CROSS_PRODUCT") and node.children:
+            node.cost = math.prod(max(child.estimated_rows, 1.0) for child in node.children)
+        cost += node.cost
+    rows = roots[0].estimated_rows if roots else 0.0
+    return cost, rows, roots
+
+def analyze_backend_plan(plan, backend="sqlite", table_rows=None, index_rows_per_key=None, statement=None):
+    """Cost a plan in the format of the given backend (see db.backends)"""
+    if backend == "postgresql":
+        return analyze_postgres_plan(plan, table_rows)
+    if backend == "duckdb":
+        return analyze_duckdb_plan(plan, table_rows)
+    return analyze_plan(plan, table_rows, index_rows_per_key, statement)
+
+def plan_details(plan, backend="sqlite") -> List[str]:
+    """One line per plan node, in plan order"""
+    if backend == "postgresql":
+        roots = build_postgres_tree(plan)
+    elif backend == "duckdb":
+        roots = build_duckdb_tree(plan)
+    else:
+        roots = build_plan_tree(plan)
+    return [node.detail for node in walk_plan(roots)]
+
+def walk_plan(nodes: List[PlanNode]):
+    """Yield all plan nodes depth-first"""
+    for node in nodes:
+        yield node
+        yield from walk_plan(node.children)
@@ -0,0 +1,83 @@
+import sqlparse
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple, Union
+from scorer.query_matcher import QueryNormalizer, QueryFingerprint, QueryVectorizer, SparseVector, group_key
+
+# Cached properties derived from the query text alone, which copies keep
+DERIVED_PROPERTIES = ("statement", "signature", "band_keys", "vector")
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    """
+    Everything derived from a query's text, computed once and shared by
+    normalization, fingerprinting, similarity search and linting
+    """
+    query: str
+    normalized: str
+    structure: Tuple[str, ...]
+    group: str
+    # Lint results, attached by scorer.scorer.prepare_query
+    violation_summary: Optional[Dict[str, int]] = field(default=None, compare=False)
+    formatted_query: Optional[str] = field(default=None, compare=False)
+    lint_dialect: Optional[str] = field(default=None, compare=False)
+
+    @classmethod
+    def from_query(cls, query: str) -> "QueryAnalysis":
+        """Parse the query once and derive its normalization and structure"""
+        statement = sqlparse.parse(query)[0]
+        normalized = QueryNormalizer.normalize_whitespace(
+            QueryNormalizer.normalize_parameters(query)
+        )
+        structure = tuple(QueryNormalizer.extract_structure(statement))
+        analysis = cls(query, normalized, structure, group_key(statement))
+        # Keep the parse tree instead of parsing again on first access
+        analysis.__dict__["statement"] = statement
+        return analysis
+
+    @staticmethod
+    def of(query: Union[str, "QueryAnalysis"]) -> "QueryAnalysis":
+        """Return query as a QueryAnalysis, analyzing raw text if needed"""
+        if isinstance(query, QueryAnalysis):
+            return query
+        return QueryAnalysis.from_query(query)
+
+    def with_lint(self, violation_summary: Dict[str, int], formatted_query: str,
+                  lint_dialect: Optional[str] = None) -> "QueryAnalysis":
+        """Return a copy carrying sqlfluff lint results, and whatever was already derived from the text"""
+        linted = replace(self, violation_summary=violation_summary, formatted_query=formatted_query,
+                         lint_dialect=lint_dialect)
+        for name in DERIVED_PROPERTIES:
+            if name in self.__dict__:
+                linted.__dict__[name] = self.__dict__[name]
+        return linted
+
+    @property
+    def linted(self) -> bool:
+        return self.violation_summary is not None
+
+    @cached_property
+    def statement(self) -> sqlparse.sql.Statement:
+        """Parsed token stream of the query"""
+        return sqlparse.parse(self.query)[0]
+
+    @cached_property
+    def signature(self) -> List[int]:
+        """MinHash fingerprint of the normalized query"""
+        return QueryFingerprint.signature(self.normalized, list(self.structure))
+
+    @cached_property
+    def band_keys(self) -> List[Tuple[int, str]]:
+        """LSH (band, bucket) keys of the fingerprint"""
+        return QueryFingerprint.band_keys(self.signature)
+
+    @cached_property
+    def vector(self) -> SparseVector:
+        """Sparse n-gram and structure vector similarity is computed from"""
+        return QueryVectorizer.sparse_vector(self.normalized, list(self.structure))
+
+    def __getstate__(self):
+        # The parse tree is large and cheap to rebuild; ship only the derived values
+        state = dict(self.__dict__)
+        state.pop("statement", None)
+        return state
@@ -1,10 +1,17 @@
 import sqlparse
 from sqlparse.sql import Token, Where, Comparison, Identifier, TokenList
-from sqlparse.tokens import Keyword, DML, DDL, Punctuation, Number, String
+from sqlparse.tokens import Keyword, DML, DDL, Punctuation, Number, String, Literal, Name, Comment, Operator
 import re
-from difflib import SequenceMatcher
+import zlib
+import random
+import struct
+import hashlib
+import numpy as np
 from typing import List, Tuple, Set
 
+# (text bucket indices, text weights, structure bucket indices), see QueryVectorizer.sparse_vector
+SparseVector = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
 class QueryNormalizer:
     @staticmethod
     def normalize_parameters(query: str) -> str:
@@ -26,7 +33,18 @@ class QueryNormalizer:
         elements = []
         
         def process_token(token):
-            if isinstance(token, Token):
+            # Groups are checked first: TokenList is itself a Token subclass
+            if isinstance(token, Where):
+                elements.append("WHERE")
+                for item in token.tokens:
+                    if isinstance(item, Comparison):
+                        elements.append("COMPARISON")
+                    else:
+                        process_token(item)
+            elif isinstance(token, TokenList):
+                for item in token.tokens:
+                    process_token(item)
+            elif isinstance(token, Token):
                 if token.ttype in (Keyword, DML, DDL):
                     elements.append(f"KEYWORD:{token.value.upper()}")
                 elif token.ttype == Identifier:
@@ -37,16 +55,6 @@ class QueryNormalizer:
                     elements.append("STRING")
                 elif token.ttype == Punctuation:
                     elements.append(f"PUNCT:{token.value}")
-            elif isinstance(token, Where):
-                elements.append("WHERE")
-                for item in token.tokens:
-                    if isinstance(item, Comparison):
-                        elements.append("COMPARISON")
-                    else:
-                        process_token(item)
-            elif isinstance(token, TokenList):
-                for item in token.tokens:
-                    process_token(item)
 
         process_token(parsed)
         return elements
@@ -66,11 +74,63 @@ class QueryNormalizer:
         
         return normalized, structure
 
+class QueryVectorizer:
+    """Hashed feature vectors for normalized queries"""
+    DIMENSIONS = 1 << 12
+    MAX_NGRAM = 3
+    _TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+    @staticmethod
+    def tokenize(normalized: str) -> List[str]:
+        """Split normalized query text into word and punctuation tokens"""
+        return QueryVectorizer._TOKEN_RE.findall(normalized)
+
+    @staticmethod
+    def _buckets(features) -> np.ndarray:
+        # crc32 is stable across processes, unlike the built-in hash()
+        mask = QueryVectorizer.DIMENSIONS - 1
+        return np.fromiter(
+            (zlib.crc32(f.encode()) & mask for f in features), dtype=np.int64
+        )
+
+    @staticmethod
+    def text_vector(normalized: str) -> np.ndarray:
+        """L2-normalized counts of hashed token 1..MAX_NGRAM-grams"""
+        tokens = QueryVectorizer.tokenize(normalized)
+        features = [
+            " ".join(tokens[i:i + n])
+            for n in range(1, QueryVectorizer.MAX_NGRAM + 1)
+            for i in range(len(tokens) - n + 1)
+        ]
+        vector = np.bincount(
+            QueryVectorizer._buckets(features), minlength=QueryVectorizer.DIMENSIONS
+        ).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @staticmethod
+    def structure_vector(structure: List[str]) -> np.ndarray:
+        """Binary presence vector of hashed structure elements (set semantics)"""
+        vector = np.zeros(QueryVectorizer.DIMENSIONS, dtype=np.float32)
+        vector[QueryVectorizer._buckets(set(structure))] = 1.0
+        return vector
+
+    @staticmethod
+    def sparse_vector(normalized: str, structure: List[str]) -> SparseVector:
+        """
+        Non-zero entries of text_vector (bucket indices and weights) and the
+        buckets set in structure_vector: what similarity needs of a stored
+        group, so its text is tokenized once when it is fingerprinted
+        """
+        text = QueryVectorizer.text_vector(normalized)
+        indices = np.flatnonzero(text)
+        return indices, text[indices], np.unique(QueryVectorizer._buckets(set(structure)))
+
 class QuerySimilarity:
     @staticmethod
     def string_similarity(s1: str, s2: str) -> float:
-        """Calculate string similarity using SequenceMatcher"""
-        return SequenceMatcher(None, s1, s2).ratio()
+        """Calculate string similarity as cosine of hashed n-gram vectors"""
+        return float(QueryVectorizer.text_vector(s1) @ QueryVectorizer.text_vector(s2))
 
     @staticmethod
     def structure_similarity(s1: List[str], s2: List[str]) -> float:
@@ -94,7 +154,12 @@ class QuerySimilarity:
         # Normalize both queries
         norm1, struct1 = QueryNormalizer.normalize_query(query1)
         norm2, struct2 = QueryNormalizer.normalize_query(query2)
-        
+
+        return QuerySimilarity.normalized_similarity(norm1, struct1, norm2, struct2)
+
+    @staticmethod
+    def normalized_similarity(norm1: str, struct1: List[str], norm2: str, struct2: List[str]) -> float:
+        """Calculate overall similarity of two already normalized queries"""
         # Calculate string similarity
         string_sim = QuerySimilarity.string_similarity(norm1, norm2)
         
@@ -104,13 +169,211 @@ class QuerySimilarity:
         # Weighted combination (60% string, 40% structure)
         return 0.6 * string_sim + 0.4 * struct_sim
 
-def get_query_group(query: str, threshold: float = 0.8) -> str:
+    @staticmethod
+    def batch_similarity(normalized: str, structure: List[str],
+                         candidates: List[Tuple[str, List[str]]]) -> np.ndarray:
+        """
+        Similarity of one normalized query against many (normalized, structure)
+        candidates (see sparse_similarity)
+        """
+        return QuerySimilarity.sparse_similarity(normalized, structure, [
+            QueryVectorizer.sparse_vector(candidate, candidate_structure)
+            for candidate, candidate_structure in candidates
+        ])
+
+    @staticmethod
+    def sparse_similarity(normalized: str, structure: List[str], vectors: List[SparseVector]) -> np.ndarray:
+        """
+        Similarity of one normalized query against candidates given as
+        sparse vectors (e.g. stored with their fingerprints): the query is
+        vectorized once, and every candidate only costs a gather over its
+        non-zero buckets
+        """
+        if not vectors:
+            return np.zeros(0, dtype=np.float32)
+
+        query_text = QueryVectorizer.text_vector(normalized)
+        query_struct = QueryVectorizer.structure_vector(structure)
+        rows = np.arange(len(vectors))
+        text_rows = np.repeat(rows, [len(indices) for indices, _, _ in vectors])
+        text_indices = np.concatenate([indices for indices, _, _ in vectors])
+        text_weights = np.concatenate([weights for _, weights, _ in vectors])
+        struct_sizes = np.array([len(buckets) for _, _, buckets in vectors], dtype=np.float32)
+        struct_rows = np.repeat(rows, struct_sizes.astype(np.int64))
+        struct_buckets = np.concatenate([buckets for _, _, buckets in vectors])
+
+        string_sim = np.bincount(
+            text_rows, weights=text_weights * query_text[text_indices], minlength=len(vectors)
+        ).astype(np.float32)
+
+        # Jaccard over binary vectors: |A & B| / (|A| + |B| - |A & B|)
+        intersection = np.bincount(
+            struct_rows, weights=query_struct[struct_buckets], minlength=len(vectors)
+        ).astype(np.float32)
+        union = struct_sizes + query_struct.sum() - intersection
+        struct_sim = np.divide(
+            intersection, union, out=np.zeros_like(intersection), where=union > 0
+        )
+
+        return 0.6 * string_sim + 0.4 * struct_sim
+
+class QueryFingerprint:
+    """MinHash signature and LSH banding for normalized queries"""
+    NUM_PERMUTATIONS = 64
+    BANDS = 16
+    ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+    SHINGLE_SIZE = 3
+
+    # Mersenne prime for the universal hash family h(x) = (a * x + b) mod p
+    _PRIME = (1 << 61) - 1
+    _MAX_HASH = (1 << 64) - 1
+    _PERMUTATIONS = None
+
+    @staticmethod
+    def _hash64(value: str) -> int:
+        """Stable 64-bit hash (built-in hash() is salted per process)"""
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    @staticmethod
+    def shingles(normalized: str, structure: List[str]) -> Set[str]:
+        """Token n-grams of the normalized text plus the structure elements"""
+        tokens = normalized.split()
+        size = QueryFingerprint.SHINGLE_SIZE
+        if len(tokens) < size:
+            grams = {" ".join(tokens)} if tokens else set()
+        else:
+            grams = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        return grams | {f"S:{element}" for element in structure}
+
+    @staticmethod
+    def permutations() -> List[Tuple[int, int]]:
+        """Coefficients of the hash family, seeded so signatures match across processes"""
+        if QueryFingerprint._PERMUTATIONS is None:
+            rng = random.Random(1337)
+            prime = QueryFingerprint._PRIME
+            QueryFingerprint._PERMUTATIONS = [
+                (rng.randrange(1, prime), rng.randrange(0, prime))
+                for _ in range(QueryFingerprint.NUM_PERMUTATIONS)
+            ]
+        return QueryFingerprint._PERMUTATIONS
+
+    @staticmethod
+    def minhash(shingles: Set[str]) -> List[int]:
+        """Compute the MinHash signature of a shingle set"""
+        if not shingles:
+            return [QueryFingerprint._MAX_HASH] * QueryFingerprint.NUM_PERMUTATIONS
+
+        hashed = [QueryFingerprint._hash64(s) for s in shingles]
+        prime = QueryFingerprint._PRIME
+        return [
+            min((a * x + b) % prime for x in hashed)
+            for a, b in QueryFingerprint.permutations()
+        ]
+
+    @staticmethod
+    def signature(normalized: str, structure: List[str]) -> List[int]:
+        """MinHash signature for a normalized query and its structure"""
+        return QueryFingerprint.minhash(QueryFingerprint.shingles(normalized, structure))
+
+    @staticmethod
+    def band_keys(signature: List[int]) -> List[Tuple[int, str]]:
+        """Split a signature into LSH bands and return (band, bucket) pairs"""
+        rows = QueryFingerprint.ROWS_PER_BAND
+        keys = []
+        for band in range(QueryFingerprint.BANDS):
+            chunk = signature[band * rows:(band + 1) * rows]
+            bucket = hashlib.blake2b(pack_signature(chunk), digest_size=8).hexdigest()
+            keys.append((band, bucket))
+        return keys
+
+def pack_signature(signature: List[int]) -> bytes:
+    """Serialize a MinHash signature to bytes"""
+    return struct.pack(f">{len(signature)}Q", *signature)
+
+def unpack_signature(data: bytes) -> List[int]:
+    """Deserialize a MinHash signature from bytes"""
+    return list(struct.unpack(f">{len(data) // 8}Q", data))
+
+def pack_vector(vector: SparseVector) -> bytes:
+    """Serialize a sparse vector: both lengths, then the text buckets, weights and structure buckets"""
+    indices, weights, buckets = vector
+    return (
+        struct.pack(">HH", len(indices), len(buckets))
+        + np.asarray(indices, dtype=">u2").tobytes()
+        + np.asarray(weights, dtype=">f4").tobytes()
+        + np.asarray(buckets, dtype=">u2").tobytes()
+    )
+
+def unpack_vector(data: bytes) -> SparseVector:
+    """Deserialize a sparse vector from bytes"""
+    text_size, struct_size = struct.unpack_from(">HH", data)
+    offset = 4
+    indices = np.frombuffer(data, dtype=">u2", count=text_size, offset=offset).astype(np.int64)
+    offset += 2 * text_size
+    weights = np.frombuffer(data, dtype=">f4", count=text_size, offset=offset).astype(np.float32)
+    offset += 4 * text_size
+    buckets = np.frombuffer(data, dtype=">u2", count=struct_size, offset=offset).astype(np.int64)
+    return indices, weights, buckets
+
+# Group keys are 128-bit digests, hex encoded
+GROUP_KEY_BYTES = 16
+# IN lists of any length canonicalize to one placeholder
+_IN_LIST_RE = re.compile(r"\bIN \( \?(?: , \?)* \)")
+
+# Keywords that end an operand, so a sign after them is a binary operator
+_OPERAND_KEYWORDS = {"END", "NULL", "TRUE", "FALSE"}
+
+def _is_operand(token: Token) -> bool:
+    ttype = token.ttype
+    if ttype in Name or ttype in Literal or ttype in String.Symbol:
+        return True
+    if ttype in Keyword:
+        return token.normalized.upper() in _OPERAND_KEYWORDS
+    return token.value == ")"
+
+def canonical_tokens(statement: sqlparse.sql.Statement) -> List[str]:
     """
-    Generate a query group identifier based on similarity
-    Returns a hash that represents similar queries
+    Token stream query groups are keyed on: literals and bind parameters
+    become ?, as does a unary sign before a number (a = -5 keys like
+    a = 5, while a-5 keys like a - 5), keywords are upper-cased,
+    identifiers (quoted or not) lower-cased, and whitespace and comments
+    are dropped
     """
-    normalized, structure = QueryNormalizer.normalize_query(query)
-    
-    # Combine normalized query and structure for hashing
-    combined = f"{normalized}|{'|'.join(structure)}"
-    return combined 
\ No newline at end of file
+    tokens = []
+    # Last two significant source tokens, to tell a unary sign from a binary one
+    previous = []
+    for token in statement.flatten():
+        ttype = token.ttype
+        if token.is_whitespace or ttype in Comment:
+            continue
+        if ttype in String.Symbol:
+            # "Quoted" identifiers
+            tokens.append(token.value.strip('"').lower())
+        elif ttype in Literal or ttype in Name.Placeholder:
+            if (ttype in Number and previous and previous[-1].value in ("-", "+")
+                    and previous[-1].ttype in Operator
+                    and (len(previous) < 2 or not _is_operand(previous[-2]))):
+                tokens.pop()
+            elif ttype in Number and token.value[0] in "-+" and previous and _is_operand(previous[-1]):
+                # sqlparse lexes a-5 as a and -5: the sign is a binary operator
+                tokens.append(token.value[0])
+            tokens.append("?")
+        elif ttype in Keyword or ttype in DML or ttype in DDL:
+            tokens.append(token.normalized.upper())
+        else:
+            tokens.append(token.value.lower())
+        previous = [*previous[-1:], token]
+    return tokens
+
+def group_key(statement: sqlparse.sql.Statement) -> str:
+    """
+    Query group identifier: a fixed-width digest of the canonical token
+    stream, so queries differing only in literals, IN-list length, case or
+    formatting share a group. Stable across processes and versions of Python
+    """
+    canonical = _IN_LIST_RE.sub("IN ( ? )", " ".join(canonical_tokens(statement)))
+    return hashlib.blake2b(canonical.encode(), digest_size=GROUP_KEY_BYTES).hexdigest()
+
+def get_query_group(query: str) -> str:
+    """Group key (see group_key) of the first statement in query"""
+    return group_key(sqlparse.parse(query)[0])
\ No newline at end of file
@@ -0,0 +1,193 @@
+import os
+import tempfile
+import sqlparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from db.config import DB_URL
+from db.database import (
+    get_engine, dispose_engine, run_explain, get_table_stats, snapshot_database, reject_outliers,
+    summarize_samples,
+)
+from db.backends import get_backend
+from scorer.compare import run_once
+from scorer.plan_analyzer import plan_details
+from scorer.query_analysis import QueryAnalysis
+from scorer.scorer import analyze_explain_plan
+from scorer.statistics import mann_whitney_u, benjamini_hochberg
+
+SIDES = ("before", "after")
+
+def target_url(target: Optional[str]) -> str:
+    """Database URL of a target given as a URL or a SQLite file path (default: the configured database)"""
+    if target is None:
+        return DB_URL
+    return target if "://" in target else f"sqlite:///{os.path.abspath(target)}"
+
+def _apply_ddl(db_url, ddl):
+    """Run a DDL script (;-separated statements) in one transaction"""
+    with get_engine(db_url).begin() as conn:
+        for statement in sqlparse.split(ddl):
+            if statement.strip():
+                conn.execute(text(statement))
+
+@contextmanager
+def regression_targets(before=None, after=None, ddl_path=None):
+    """
+    Yield the {before, after} URLs to compare
+    With ddl_path, both sides are snapshots of the (SQLite) before database,
+    the after one with the script applied, so the original is never changed
+    """
+    before_url = target_url(before)
+    if ddl_path is None:
+        if after is None:
+            raise ValueError("An after database or a DDL script is required")
+        yield {"before": before_url, "after": target_url(after)}
+        return
+
+    if make_url(before_url).get_backend_name() != "sqlite":
+        raise ValueError("DDL scripts can only be applied to snapshots of SQLite databases")
+    with open(ddl_path, "r") as f:
+        ddl = f.read()
+    source = make_url(before_url).database
+    with tempfile.TemporaryDirectory(prefix="sql-scorer-regression-") as directory:
+        urls = {side: snapshot_database(os.path.join(directory, f"{side}.db"), source) for side in SIDES}
+        try:
+            _apply_ddl(urls["after"], ddl)
+            yield urls
+        finally:
+            for url in urls.values():
+                dispose_engine(url)
+
+def _plan(query, db_url, table_stats):
+    """(plan details, estimated cost) of query on db_url"""
+    backend = get_backend(db_url).name
+    plan = run_explain(query, db_url=db_url)
+    _, _, estimate = analyze_explain_plan(plan, QueryAnalysis.of(query), table_stats, backend)
+    return plan_details(plan, backend), estimate["cost"]
+
+def compare_targets(queries: List[str], urls: dict, rounds=10, warmup=1, parallel=True,
+                    alpha=0.05, tolerance=0.05) -> List[dict]:
+    """
+    Benchmark a query corpus on the before and after databases and report
+    per query group (see QueryAnalysis.group) how much faster it got.
+    Runs are interleaved: every round runs each query once on both sides,
+    at the same time when parallel (the targets are independent
+    databases), alternating which side starts. Speedup is the before/after
+    ratio of the pooled group medians; significance is a Mann-Whitney test
+    with Benjamini-Hochberg correction across groups. Verdicts are 'faster'
+    or 'slower' only when significant and beyond tolerance; a group with
+    queries that fail on after but not on before is 'broken'.
+    Returns rows, regressions first
+    """
+    analyses = [QueryAnalysis.from_query(query) for query in queries]
+    samples = {side: [[] for _ in queries] for side in SIDES}
+    # Queries that failed, per side; a query is dropped after its first failure
+    failures = {side: set() for side in SIDES}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=2 if parallel else 1) as threads:
+        for round_index in range(warmup + rounds):
+            for i, query in enumerate(queries):
+                if i in failed:
+                    continue
+                # Neither side always runs first, on caches the other just warmed
+                order = SIDES if (round_index + i) % 2 == 0 else SIDES[::-1]
+                futures = {side: threads.submit(run_once, query, urls[side]) for side in order}
+                for side, future in futures.items():
+                    elapsed = future.result()
+                    if elapsed is None:
+                        failures[side].add(i)
+                        failed.add(i)
+                    elif round_index >= warmup:
+                        samples[side][i].append(elapsed)
+
+    table_stats = {side: get_table_stats(urls[side]) for side in SIDES}
+    groups = {}
+    for i, analysis in enumerate(analyses):
+        groups.setdefault(analysis.group, []).append(i)
+
+    rows = []
+    for group, indices in groups.items():
+        row = {"group": group, "query": queries[indices[0]], "queries": len(indices)}
+        for side in SIDES:
+            row[f"failed_{side}"] = sum(i in failures[side] for i in indices)
+        # Queries the change broke: they work before but not after
+        row["broken"] = sum(i in failures["after"] and i not in failures["before"] for i in indices)
+        measured = [i for i in indices if i not in failed]
+        if not measured:
+            row["error"] = "Query execution failed."
+            if row["broken"]:
+                row["verdict"] = "broken"
+            rows.append(row)
+            continue
+
+        plans = {
+            side: [_plan(queries[i], urls[side], table_stats[side]) for i in measured]
+            for side in SIDES
+        }
+        for side in SIDES:
+            pooled = [t for i in measured for t in samples[side][i]]
+            kept, _ = reject_outliers(pooled)
+            summary = summarize_samples(kept)
+            row[f"{side}_median"] = summary["median"]
+            row[f"{side}_ci"] = [summary["ci_low"], summary["ci_high"]]
+            row[f"{side}_cost"] = sum(cost for _, cost in plans[side])
+        row["speedup"] = row["before_median"] / row["after_median"] if row["after_median"] > 0 else 1.0
+        _, row["p_value"] = mann_whitney_u(
+            [t for i in measured for t in samples["before"][i]],
+            [t for i in measured for t in samples["after"][i]],
+        )
+        row["plan_changed"] = any(b != a for (b, _), (a, _) in zip(plans["before"], plans["after"]))
+        row["failed"] = len(indices) - len(measured)
+        rows.append(row)
+
+    measured_rows = [row for row in rows if "error" not in row]
+    for row, q_value in zip(measured_rows, benjamini_hochberg([row["p_value"] for row in measured_rows])):
+        row["q_value"] = q_value
+        row["significant"] = q_value < alpha
+        if row["significant"] and row["speedup"] < 1 / (1 + tolerance):
+            row["verdict"] = "slower"
+        elif row["significant"] and row["speedup"] > 1 + tolerance:
+            row["verdict"] = "faster"
+        else:
+            row["verdict"] = "unchanged"
+        if row["broken"]:
+            row["verdict"] = "broken"
+
+    measured_rows.sort(key=lambda row: (row["verdict"] != "broken", row["speedup"]))
+    error_rows = [row for row in rows if "error" in row]
+    broken = [row for row in error_rows if row.get("verdict") == "broken"]
+    return broken + measured_rows + [row for row in error_rows if row.get("verdict") != "broken"]
+
+def regressions(rows: List[dict]) -> List[dict]:
+    """Groups that got significantly slower, or that have queries only failing after the change"""
+    return [row for row in rows if row.get("verdict") in ("slower", "broken")]
+
+def format_regression(rows: List[dict]) -> str:
+    """Render compare_targets rows as a text table with a summary line"""
+    lines = [
+        f"{'Query':<40} {'N':>3} {'Before (ms)':>12} {'After (ms)':>11} {'Speedup':>8} "
+        f"{'q-value':>8} {'Plan':>7}  Verdict"
+    ]
+    counts = {"faster": 0, "slower": 0, "unchanged": 0, "broken": 0, "failed": 0}
+    for row in rows:
+        query = " ".join(row["query"].split())
+        query = query if len(query) <= 40 else query[:37] + "..."
+        if "error" in row:
+            counts[row.get("verdict", "failed")] += 1
+            if row.get("verdict") == "broken":
+                sides = "after only"
+            else:
+                sides = "both" if row["failed_before"] and row["failed_after"] else "before only"
+            lines.append(f"{query:<40} {row['queries']:>3} {row['error']} (failed on {sides})")
+            continue
+        counts[row["verdict"]] += 1
+        lines.append(
+            f"{query:<40} {row['queries']:>3} {row['before_median'] * 1000:>12.3f} "
+            f"{row['after_median'] * 1000:>11.3f} {row['speedup']:>7.2f}x {row['q_value']:>8.4f} "
+            f"{'changed' if row['plan_changed'] else 'same':>7}  {row['verdict']}"
+        )
+    lines.append(", ".join(f"{count} {name}" for name, count in counts.items()))
+    return "\n".join(lines)
@@ -1,44 +1,115 @@
-import sqlfluff
+import sys
 import sqlparse
 from collections import defaultdict
-from db.database import execute_sql, run_explain
-from scorer.performance_metrics import store_performance_metrics, calculate_performance_score
+from db.database import benchmark_sql, run_explain, get_table_stats
+from db.backends import get_backend
+from db.sandbox import LimitExceeded
+from scorer.performance_metrics import store_performance_metrics, calculate_performance_score, predict_performance
+from scorer.query_analysis import QueryAnalysis
+from scorer.lint_cache import lint_cache
+from scorer.plan_analyzer import analyze_backend_plan, plan_details, walk_plan
+from scorer.tracing import Trace, span, profiled_call
 import math
 
-def analyze_sql(query):
-    """Analyzes SQL Query Readability & Best Practices"""
-    parsed = sqlparse.format(query, reindent=True)
-    lint_result = sqlfluff.lint(parsed, dialect="postgres")
+# sqlfluff dialect of the configured database; other targets use their backend's
+LINT_DIALECT = get_backend().lint_dialect
 
-    categorized = defaultdict(int)
+# sqlfluff rule categories penalized in the optimization and readability scores
+OPTIMIZATION_CATEGORIES = ["aliasing.table", "ambiguous.join", "unnecessary.subquery"]
+READABILITY_PREFIXES = ("layout.", "indent.")
+# Penalty per violation of the optimization and readability scores
+OPTIMIZATION_WEIGHT = 5
+READABILITY_WEIGHT = 2
+# Decay rate of calculate_normalized_score: how quickly penalties eat into the score
+DECAY = 2.0
 
-    for v in lint_result:
-        category = v.get("name", "unknown")
-        categorized[category] += 1
+def analyze_sql(query, dialect=None):
+    """Analyzes SQL Query Readability & Best Practices (QueryAnalysis or SQL text)"""
+    if isinstance(query, QueryAnalysis):
+        query = query.query
+    dialect = dialect or LINT_DIALECT
 
+    def lint():
+        # sqlfluff takes a while to import, and cache hits never need it
+        import sqlfluff
+        parsed = sqlparse.format(query, reindent=True)
+        lint_result = sqlfluff.lint(parsed, dialect=dialect)
+
+        categorized = defaultdict(int)
+
+        for v in lint_result:
+            category = v.get("name", "unknown")
+            categorized[category] += 1
+
+        return {
+            "violation_summary": dict(categorized),
+            "formatted_query": parsed,
+        }
+
+    cached = lint_cache.get_or_compute("lint", query, dialect, lint)
+    # Copy so callers can't mutate the cached entry
     return {
-        "violation_summary": dict(categorized),
-        "formatted_query": parsed,
+        "violation_summary": dict(cached["violation_summary"]),
+        "formatted_query": cached["formatted_query"],
     }
 
-def analyze_explain_plan(plan_rows):
-    """Analyzes EXPLAIN QUERY PLAN output and returns score and notes"""
-    penalties = 0
-    notes = []
+def fix_sql(query, dialect=None):
+    """Returns the sqlfluff-fixed version of a query, using the lint cache"""
+    dialect = dialect or LINT_DIALECT
+
+    def fix():
+        import sqlfluff
+        return sqlfluff.fix(query, dialect=dialect) or query
+
+    return lint_cache.get_or_compute("fix", query, dialect, fix)
+
+def prepare_query(query, db_url=None):
+    """
+    Run the CPU-bound analysis of a query (sqlparse parse/normalization
+    and sqlfluff lint in the dialect of db_url's backend) so it can be done
+    ahead of execution, e.g. in a worker process. Nothing connects to db_url.
+    Returns a linted QueryAnalysis
+    """
+    analysis = QueryAnalysis.of(query)
+    dialect = get_backend(db_url).lint_dialect
+    if analysis.linted and analysis.lint_dialect == dialect:
+        return analysis
+    lint = analyze_sql(analysis, dialect)
+    return analysis.with_lint(lint["violation_summary"], lint["formatted_query"], dialect)
+
+def analyze_explain_plan(plan_rows, analysis=None, table_stats=None, backend="sqlite"):
+    """
+    Analyzes EXPLAIN output with a cost model
+    plan_rows: plan as returned by db.database.run_explain for the backend
+    table_stats: (table_rows, index_rows_per_key) as from db.database.get_table_stats
+    Returns score (0-10), notes and the plan estimate
+    """
+    table_rows, index_rows_per_key = table_stats or ({}, {})
+    statement = analysis.statement if analysis is not None else None
+    cost, rows, roots = analyze_backend_plan(plan_rows, backend, table_rows, index_rows_per_key, statement)
 
-    for row in plan_rows:
-        detail = row[3].upper() 
-        if "SCAN" in detail and "USING INDEX" not in detail:
-            penalties += 5
-            notes.append(f"Full table scan: '{detail}'")
-        if "SUBQUERY" in detail:
-            penalties += 3
+    notes = []
+    for node in walk_plan(roots):
+        detail = node.detail.upper()
+        operation = node.operation
+        if operation == "scan" and "USING" not in detail:
+            notes.append(f"Full table scan: '{detail}' (~{node.estimated_rows:.0f} rows)")
+        if operation in ("subquery", "correlated_subquery"):
             notes.append(f"Subquery usage: '{detail}'")
-        if "USING INDEX" in detail:
+        if operation == "correlated_subquery":
+            notes.append(f"Correlated subquery runs once per outer row: '{detail}'")
+        if operation == "search" or ("USING" in detail and "INDEX" in detail) or "PRIMARY KEY" in detail:
             notes.append(f"Index usage: '{detail}'")
+        if operation == "temp_btree":
+            notes.append(f"Temporary B-tree: '{detail}' (~{node.estimated_rows:.0f} rows)")
+        if operation == "sort":
+            notes.append(f"Sort: '{detail}' (~{node.estimated_rows:.0f} rows)")
+    if plan_rows:
+        notes.append(f"Estimated cost: ~{cost:.0f} rows touched, ~{rows:.0f} rows returned")
 
-    explain_score = max(0, 10 - penalties)  
-    return explain_score, notes
+    # Logarithmic in the rows touched: ~10 for a handful, 5.5 at 1K, 1 at 1M, 0 from 10M
+    explain_score = max(0.0, 10 - 1.5 * math.log10(max(cost, 1.0)))
+    return explain_score, notes, {"cost": cost, "rows": rows}
 
 def calculate_normalized_score(base_score: float, penalties: float, max_penalties: float) -> float:
     """
@@ -53,17 +124,88 @@ def calculate_normalized_score(base_score: float, penalties: float, max_penaltie
     # Normalize penalties to a value between 0 and 1
     normalized_penalties = min(penalties / max_penalties, 1.0)
     
-    # Use exponential decay: score = base_score * e^(-k * normalized_penalties)
-    # where k controls how quickly the score decays
-    k = 2.0  # Adjust this value to control decay rate
-    return base_score * math.exp(-k * normalized_penalties)
+    # Use exponential decay: score = base_score * e^(-DECAY * normalized_penalties)
+    return base_score * math.exp(-DECAY * normalized_penalties)
+
+def calculate_static_scores(violations, explain_score):
+    """
+    Scores that need no execution: returns (optimization, readability)
+    """
+    # ---------- 2. Best Practices / Optimization (30 pts) ----------
+    # Calculate penalties and maximum possible penalties
+    opt_penalties = sum(violations.get(cat, 0) for cat in OPTIMIZATION_CATEGORIES) * OPTIMIZATION_WEIGHT
+    max_opt_penalties = len(OPTIMIZATION_CATEGORIES) * OPTIMIZATION_WEIGHT  # Maximum possible penalties
+    
+    # Calculate normalized optimization score
+    opt_score = calculate_normalized_score(30, opt_penalties, max_opt_penalties)
+    # Add explain score (up to 10 points) proportionally
+    opt_score = min(30, opt_score + explain_score)
+
+    # ---------- 3. Readability / Layout (20 pts) ----------
+    readability_categories = [k for k in violations if k.startswith(READABILITY_PREFIXES)]
+    # Calculate penalties and maximum possible penalties
+    read_penalties = sum(violations[k] for k in readability_categories) * READABILITY_WEIGHT
+    max_read_penalties = len(readability_categories) * READABILITY_WEIGHT  # Maximum possible penalties
+    
+    # Calculate normalized readability score
+    read_score = calculate_normalized_score(20, read_penalties, max_read_penalties)
+
+    return opt_score, read_score
 
-def score_query(query):
-    exec_time, cpu_usage, row_count = execute_sql(query)
-    plan_rows = run_explain(query)
-    explain_score, explain_notes = analyze_explain_plan(plan_rows)
+def score_query(query, warmup=None, iterations=None, db_url=None, dry_run=False, trace=False, profile=None,
+                limits=None, cancel=None):
+    """
+    Score a query
+    query: SQL text or a QueryAnalysis (e.g. from prepare_query)
+    warmup, iterations: benchmark runs (defaults from db.config)
+    db_url: database to run the query against (default: db.config.DB_URL)
+    dry_run: never execute the query, see score_query_dry
+    trace: add the per-stage spans (wall and CPU time) under 'trace': execute,
+    explain, plan (cost model), lint, store (predict for dry runs),
+    thresholds and similarity
+    profile: run under cProfile; None samples at db.config.PROFILE_SAMPLE_RATE
+    limits: db.sandbox.Limits of every run (default: timeout, memory and row
+    limits from db.config); cancel: threading.Event that stops the query
+    """
+    with Trace() as current:
+        result = profiled_call(
+            current, _score_query, query, warmup, iterations, db_url, dry_run, limits, cancel, profile=profile
+        )
+    if trace:
+        result["trace"] = current.to_dict()
+    return result
+
+def _score_query(query, warmup, iterations, db_url, dry_run, limits, cancel):
+    if dry_run:
+        return score_query_dry(query, db_url=db_url)
 
-    if exec_time is None:
+    analysis = QueryAnalysis.of(query)
+    backend = get_backend(db_url)
+    try:
+        with span("execute"):
+            benchmark = benchmark_sql(analysis.query, warmup=warmup, iterations=iterations, db_url=db_url,
+                                      limits=limits, cancel=cancel)
+    except LimitExceeded as e:
+        print(f"Query stopped: {e}", file=sys.stderr)
+        return {
+            "error": str(e),
+            "limit": e.reason,
+            "resources": e.resources,
+            "execution_time": None,
+            "cpu_usage": None,
+            "rows_affected": None,
+            "violations": [],
+            "violation_summary": {},
+            "score": 0
+        }
+    with span("explain"):
+        plan_rows = run_explain(analysis.query, db_url=db_url, analyze=True, limits=limits, cancel=cancel)
+    with span("plan"):
+        explain_score, explain_notes, plan_estimate = analyze_explain_plan(
+            plan_rows, analysis, get_table_stats(db_url), backend.name
+        )
+
+    if benchmark is None:
         return {
             "error": "Query execution failed.",
             "execution_time": None,
@@ -74,37 +216,33 @@ def score_query(query):
             "score": 0
         }
 
-    # Store performance metrics for future threshold calculations
-    store_performance_metrics(exec_time, cpu_usage, query)
+    # Score on the median of the measured runs rather than a single sample
+    exec_time = benchmark["execution_time"]["median"]
+    cpu_usage = benchmark["cpu_usage"]["median"]
+    row_count = benchmark["rows_affected"]
 
-    analysis = analyze_sql(query)
-    violations = analysis["violation_summary"]
+    with span("lint"):
+        analysis = prepare_query(analysis, db_url)
 
     # ---------- 1. Computational Performance (50 pts) ----------
-    # Use dynamic thresholds for performance scoring
-    perf_score = calculate_performance_score(exec_time, cpu_usage, query)
+    # Use dynamic thresholds for performance scoring, computed before this
+    # run is stored so it is never measured against itself
+    with span("thresholds"):
+        perf_score = calculate_performance_score(exec_time, cpu_usage, analysis)
 
-    # ---------- 2. Best Practices / Optimization (30 pts) ----------
-    optimization_categories = [
-        "aliasing.table", "ambiguous.join", "unnecessary.subquery"
-    ]
-    # Calculate penalties and maximum possible penalties
-    opt_penalties = sum(violations.get(cat, 0) for cat in optimization_categories) * 5
-    max_opt_penalties = len(optimization_categories) * 5  # Maximum possible penalties
-    
-    # Calculate normalized optimization score
-    opt_score = calculate_normalized_score(30, opt_penalties, max_opt_penalties)
-    # Add explain score (up to 10 points) proportionally
-    opt_score = min(30, opt_score + explain_score)
+    # Store performance metrics for future threshold calculations
+    with span("store"):
+        store_performance_metrics(exec_time, cpu_usage, analysis)
 
-    # ---------- 3. Readability / Layout (20 pts) ----------
-    readability_categories = [k for k in violations if k.startswith("layout.") or k.startswith("indent.")]
-    # Calculate penalties and maximum possible penalties
-    read_penalties = sum(violations[k] for k in readability_categories) * 2
-    max_read_penalties = len(readability_categories) * 2  # Maximum possible penalties
-    
-    # Calculate normalized readability score
-    read_score = calculate_normalized_score(20, read_penalties, max_read_penalties)
+    violations = dict(analysis.violation_summary)
+
+    plan_io = backend.plan_io(plan_rows)
+    resources = dict(benchmark["resources"])
+    if plan_io is not None:
+        # Buffers the server read for the EXPLAIN ANALYZE run
+        resources["pages_read"] = backend.pages_read(None, plan_io)
+
+    opt_score, read_score = calculate_static_scores(violations, explain_score)
 
     # ---------- Total Score ----------
     total_score = round(perf_score + opt_score + read_score, 2)
@@ -113,14 +251,82 @@ def score_query(query):
         "execution_time": exec_time,
         "cpu_usage": cpu_usage,
         "rows_affected": row_count,
-        "formatted_query": analysis["formatted_query"],
+        "benchmark": benchmark,
+        "backend": backend.name,
+        # Buffer counters of the EXPLAIN ANALYZE run (PostgreSQL), else per-run process I/O
+        "io": plan_io or benchmark["io"],
+        # Peak RSS and CPU time are this process's: the engine's too when it is embedded
+        "resources": resources,
+        "formatted_query": analysis.formatted_query,
         "violation_summary": violations,
-        "explain_plan": [row[3] for row in plan_rows],
+        "explain_plan": plan_details(plan_rows, backend.name),
         "explain_notes": explain_notes,
+        "explain_estimate": plan_estimate,
         "score_breakdown": {
             "performance": perf_score,
             "optimization": opt_score,
             "readability": read_score
         },
         "score": total_score
-    }
\ No newline at end of file
+    }
+
+def score_query_dry(query, db_url=None):
+    """
+    Score a query without executing it
+    Execution time and CPU usage are predicted from the history of similar
+    queries, or from the EXPLAIN cost estimate when there is none. Nothing
+    is stored in the performance history.
+    """
+    analysis = QueryAnalysis.of(query)
+    try:
+        with span("explain"):
+            plan_rows = run_explain(analysis.query, db_url=db_url, raise_errors=True)
+    except Exception as e:
+        print(f"Failed to run EXPLAIN: {e}", file=sys.stderr)
+        return {
+            "error": "Query planning failed.",
+            "dry_run": True,
+            "execution_time": None,
+            "cpu_usage": None,
+            "rows_affected": None,
+            "violations": [],
+            "violation_summary": {},
+            "score": 0
+        }
+    with span("plan"):
+        explain_score, explain_notes, plan_estimate = analyze_explain_plan(
+            plan_rows, analysis, get_table_stats(db_url), get_backend(db_url).name
+        )
+
+    with span("lint"):
+        analysis = prepare_query(analysis, db_url)
+    violations = dict(analysis.violation_summary)
+
+    with span("predict"):
+        prediction = predict_performance(analysis, plan_estimate["cost"])
+    with span("thresholds"):
+        perf_score = calculate_performance_score(
+            prediction["execution_time"], prediction["cpu_usage"], analysis
+        )
+    opt_score, read_score = calculate_static_scores(violations, explain_score)
+    total_score = round(perf_score + opt_score + read_score, 2)
+
+    return {
+        "dry_run": True,
+        "execution_time": prediction["execution_time"],
+        "cpu_usage": prediction["cpu_usage"],
+        "rows_affected": None,
+        "prediction": prediction,
+        "backend": get_backend(db_url).name,
+        "formatted_query": analysis.formatted_query,
+        "violation_summary": violations,
+        "explain_plan": plan_details(plan_rows, get_backend(db_url).name),
+        "explain_notes": explain_notes,
+        "explain_estimate": plan_estimate,
+        "score_breakdown": {
+            "performance": perf_score,
+            "optimization": opt_score,
+            "readability": read_score
+        },
+        "score": total_score
+    }
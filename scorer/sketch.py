@@ -0,0 +1,93 @@
+import math
+import json
+from typing import Dict, Iterable
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with bounded relative error (DDSketch-style)
+    Positive values are counted in logarithmic buckets, so any quantile is
+    returned within relative_accuracy of the true value while memory stays
+    bounded by max_buckets regardless of how many values were added.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    # Values at or below this are treated as zero
+    MIN_VALUE = 1e-9
+
+    def add(self, value: float, count: int = 1):
+        """Add a value (count times)"""
+        if value is None:
+            return
+        self.count += count
+        if value <= self.MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def add_all(self, values: Iterable[float]):
+        """Add many values"""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "QuantileSketch"):
+        """Merge another sketch with the same accuracy into this one"""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        """Return the estimated q-quantile (0 <= q <= 1), or None if empty"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def _collapse(self):
+        """Fold the lowest buckets together to respect max_buckets"""
+        indexes = sorted(self.buckets)
+        excess = len(indexes) - self.max_buckets
+        target = indexes[excess]
+        for index in indexes[:excess]:
+            self.buckets[target] += self.buckets.pop(index)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "a": self.relative_accuracy,
+            "m": self.max_buckets,
+            "z": self.zero_count,
+            "b": self.buckets,
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "QuantileSketch":
+        payload = json.loads(data)
+        sketch = cls(payload["a"], payload["m"])
+        sketch.buckets = {int(index): count for index, count in payload["b"].items()}
+        sketch.zero_count = payload["z"]
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
@@ -0,0 +1,61 @@
+import math
+import numpy as np
+
+def _rank(values):
+    """Ranks starting at 1, with ties given their average rank"""
+    order = np.argsort(values, kind="mergesort")
+    ranks = np.empty(len(values), dtype=float)
+    sorted_values = values[order]
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and sorted_values[j + 1] == sorted_values[i]:
+            j += 1
+        ranks[order[i:j + 1]] = (i + j) / 2 + 1
+        i = j + 1
+    return ranks
+
+def mann_whitney_u(a, b):
+    """
+    Two-sided Mann-Whitney U test for a difference between two samples
+    Uses the tie-corrected normal approximation, which is adequate from
+    about 5 samples per side. Returns (U statistic of a, p-value)
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return None, 1.0
+
+    combined = np.concatenate([a, b])
+    ranks = _rank(combined)
+    u1 = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+
+    n = n1 + n2
+    _, tie_counts = np.unique(combined, return_counts=True)
+    tie_term = ((tie_counts ** 3) - tie_counts).sum() / (n * (n - 1)) if n > 1 else 0.0
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term)
+    if variance <= 0:
+        return float(u1), 1.0
+
+    # Continuity-corrected z score
+    z = (abs(u1 - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    p_value = math.erfc(max(z, 0) / math.sqrt(2))
+    return float(u1), min(1.0, p_value)
+
+def benjamini_hochberg(p_values):
+    """
+    Benjamini-Hochberg adjusted p-values (q-values), which control the false
+    discovery rate when many tests are read together. Returns a list in input order
+    """
+    p = np.asarray(p_values, dtype=float)
+    n = len(p)
+    if n == 0:
+        return []
+    order = np.argsort(p)
+    ranked = p[order] * n / np.arange(1, n + 1)
+    # Monotone from the largest p-value down
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    q_values = np.empty(n)
+    q_values[order] = np.minimum(adjusted, 1.0)
+    return q_values.tolist()
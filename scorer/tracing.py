@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import uuid
+import random
+import cProfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from db.config import PROFILE_SAMPLE_RATE, PROFILE_DIR
+
+# Called with every finished span dict; register with add_span_hook
+_span_hooks = []
+
+# Trace of the score_query call running in the current thread/task
+_current_trace = ContextVar("sql_scorer_trace", default=None)
+
+def add_span_hook(hook):
+    """
+    Register hook(span) to receive every finished span, e.g. to forward it
+    to a tracing or metrics backend. Spans are dicts with trace_id, name,
+    parent, start (seconds into the trace), wall and cpu (seconds)
+    """
+    _span_hooks.append(hook)
+
+def remove_span_hook(hook):
+    if hook in _span_hooks:
+        _span_hooks.remove(hook)
+
+class Trace:
+    """Per-stage spans of one score_query call"""
+
+    def __init__(self, name="score_query"):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.spans = []
+        self.profile = None
+        self._stack = []
+        self._token = None
+        self._start = None
+
+    def __enter__(self):
+        self._token = _current_trace.set(self)
+        self._start = time.perf_counter()
+        self._stack.append((self.name, self._start, time.thread_time()))
+        return self
+
+    def __exit__(self, *exc):
+        self._finish()
+        _current_trace.reset(self._token)
+        return False
+
+    @contextmanager
+    def span(self, name):
+        """Time a stage; spans opened inside it record it as their parent"""
+        self._stack.append((name, time.perf_counter(), time.thread_time()))
+        try:
+            yield
+        finally:
+            self._finish()
+
+    def _finish(self):
+        name, start, start_cpu = self._stack.pop()
+        span = {
+            "trace_id": self.id,
+            "name": name,
+            "parent": self._stack[-1][0] if self._stack else None,
+            "start": start - self._start,
+            # Thread CPU time, so concurrent requests in other threads don't count
+            "wall": time.perf_counter() - start,
+            "cpu": time.thread_time() - start_cpu,
+        }
+        self.spans.append(span)
+        for hook in list(_span_hooks):
+            try:
+                hook(span)
+            except Exception as e:
+                print(f"Span hook failed: {e}", file=sys.stderr)
+
+    def to_dict(self):
+        return {"id": self.id, "spans": list(self.spans), "profile": self.profile}
+
+def format_trace(trace):
+    """Render a trace dict (as returned under 'trace') as an indented text table"""
+    depth = {}
+    lines = [f"{'Stage':<24} {'Wall (ms)':>10} {'CPU (ms)':>10}"]
+    # Spans finish innermost first; print them in start order, nested under their parent
+    for item in sorted(trace["spans"], key=lambda s: s["start"]):
+        depth[item["name"]] = depth.get(item["parent"], -1) + 1
+        label = "  " * depth[item["name"]] + item["name"]
+        lines.append(f"{label:<24} {item['wall'] * 1000:>10.3f} {item['cpu'] * 1000:>10.3f}")
+    if trace.get("profile"):
+        lines.append(f"Profile: {trace['profile']}")
+    return "\n".join(lines)
+
+@contextmanager
+def span(name):
+    """Time a stage of the current trace; does nothing outside of one"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+def profiled_call(trace, function, *args, profile=None, **kwargs):
+    """
+    Call function, under cProfile if profile is True or, when profile is
+    None, for a PROFILE_SAMPLE_RATE fraction of calls. The stats file
+    (readable with pstats or snakeviz) is recorded in trace.profile
+    """
+    if profile is None:
+        profile = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if not profile:
+        return function(*args, **kwargs)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{trace.name}_{trace.id}.prof")
+        profiler.dump_stats(path)
+        trace.profile = path
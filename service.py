@@ -0,0 +1,248 @@
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from scorer.scorer import prepare_query, score_query
+from scorer.sketch import QuantileSketch
+from db.config import TARGETS
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 1 << 20
+
+# Largest warmup and iterations a request may ask for: every run holds the
+# target's execution thread
+MAX_RUNS = {"warmup": 10, "iterations": 50}
+
+class BodyTooLarge(ValueError):
+    """The request declares a body over MAX_BODY_SIZE"""
+
+class ScoringService:
+    """
+    Scores queries for HTTP clients
+    Linting runs in a bounded process pool. Execution runs on one thread
+    per target database so timings of a target are never taken while
+    another query runs on it. Identical concurrent submissions share a
+    single evaluation.
+    """
+
+    def __init__(self, workers=None, max_pending=256):
+        self.lint_pool = ProcessPoolExecutor(max_workers=workers)
+        self.executors = {name: ThreadPoolExecutor(max_workers=1) for name in TARGETS}
+        self.slots = asyncio.Semaphore(max_pending)
+        self.inflight = {}
+        self.queued = 0
+        self.running = 0
+        self.counters = {"requests": 0, "coalesced": 0, "errors": 0, "rejected": 0}
+        self.latency = QuantileSketch()
+
+    @staticmethod
+    def request_key(payload):
+        """Identity of a submission, used to coalesce duplicates"""
+        canonical = json.dumps(payload, sort_keys=True)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    async def score(self, payload):
+        """Score a request payload, joining an identical in-flight evaluation if any"""
+        self.counters["requests"] += 1
+        key = self.request_key(payload)
+        if key in self.inflight:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(self.inflight[key])
+
+        if self.slots.locked():
+            self.counters["rejected"] += 1
+            raise OverflowError("Too many pending requests")
+
+        future = asyncio.ensure_future(self._evaluate(payload))
+        self.inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.inflight.pop(key, None)
+
+    async def _evaluate(self, payload):
+        loop = asyncio.get_running_loop()
+        target = payload.get("target", "default")
+        start = time.perf_counter()
+        async with self.slots:
+            self.queued += 1
+            try:
+                analysis = await loop.run_in_executor(
+                    self.lint_pool, prepare_query, payload["query"], TARGETS[target]
+                )
+                self.running += 1
+            finally:
+                self.queued -= 1
+            try:
+                return await loop.run_in_executor(
+                    self.executors[target], self._score, analysis, payload, TARGETS[target]
+                )
+            finally:
+                self.running -= 1
+                self.latency.add(time.perf_counter() - start)
+
+    @staticmethod
+    def _score(analysis, payload, db_url):
+        return score_query(
+            analysis,
+            warmup=payload.get("warmup"),
+            iterations=payload.get("iterations"),
+            db_url=db_url,
+            dry_run=bool(payload.get("dry_run")),
+            trace=bool(payload.get("trace")),
+        )
+
+    def metrics(self):
+        """Queue depth, counters and latency percentiles (seconds)"""
+        return {
+            "queue_depth": self.queued,
+            "running": self.running,
+            "inflight": len(self.inflight),
+            **self.counters,
+            "latency": {
+                "count": self.latency.count,
+                "p50": self.latency.quantile(0.5),
+                "p95": self.latency.quantile(0.95),
+                "p99": self.latency.quantile(0.99),
+            },
+        }
+
+    def shutdown(self):
+        self.lint_pool.shutdown(cancel_futures=True)
+        for executor in self.executors.values():
+            executor.shutdown(cancel_futures=True)
+
+def validate_payload(payload):
+    """Return an error message for an invalid /score payload, or None"""
+    if not isinstance(payload, dict) or not isinstance(payload.get("query"), str) or not payload["query"].strip():
+        return "Body must be a JSON object with a non-empty 'query'"
+    if payload.get("target", "default") not in TARGETS:
+        return f"Unknown target, expected one of {sorted(TARGETS)}"
+    for option, limit in MAX_RUNS.items():
+        value = payload.get(option)
+        # bool is an int subclass: true would pass as 1
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)
+                                  or not 0 <= value <= limit):
+            return f"'{option}' must be an integer from 0 to {limit}"
+    for option in ("dry_run", "trace"):
+        if not isinstance(payload.get(option, False), bool):
+            return f"'{option}' must be a boolean"
+    return None
+
+async def read_request(reader):
+    """
+    Read a minimal HTTP/1.1 request: (method, path, body bytes)
+    Raises ValueError on a malformed request, BodyTooLarge on an oversized body
+    """
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    parts = request_line.split(" ", 2)
+    if len(parts) != 3:
+        raise ValueError("Malformed request line")
+    method, path, _ = parts
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ValueError("Invalid Content-Length") from None
+    if length < 0:
+        raise ValueError("Invalid Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise BodyTooLarge("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], body
+
+async def write_response(writer, status, payload):
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 503: "Service Unavailable", 500: "Internal Server Error"}
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {reasons[status]}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+async def handle_connection(service, reader, writer):
+    try:
+        try:
+            request = await read_request(reader)
+        except BodyTooLarge as e:
+            await write_response(writer, 413, {"error": str(e)})
+            return
+        except ValueError as e:
+            await write_response(writer, 400, {"error": str(e)})
+            return
+        if request is None:
+            return
+        method, path, body = request
+
+        if path == "/health":
+            await write_response(writer, 200, {"status": "ok"})
+        elif path == "/metrics":
+            await write_response(writer, 200, service.metrics())
+        elif path == "/score":
+            if method != "POST":
+                await write_response(writer, 405, {"error": "Use POST"})
+                return
+            try:
+                payload = json.loads(body or b"null")
+            except json.JSONDecodeError:
+                payload = None
+            error = validate_payload(payload)
+            if error:
+                await write_response(writer, 400, {"error": error})
+                return
+            try:
+                result = await service.score(payload)
+            except OverflowError as e:
+                await write_response(writer, 503, {"error": str(e)})
+                return
+            except Exception as e:
+                service.counters["errors"] += 1
+                await write_response(writer, 500, {"error": str(e)})
+                return
+            await write_response(writer, 200, result)
+        else:
+            await write_response(writer, 404, {"error": "Not found"})
+    finally:
+        writer.close()
+
+async def serve(host, port, workers):
+    service = ScoringService(workers=workers)
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(service, r, w), host, port
+    )
+    print(f"Scoring service listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL-Scorer HTTP/JSON scoring service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for linting")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import sqlparse
+from scorer.query_matcher import canonical_tokens, get_query_group
+
+def _tokens(query):
+    return canonical_tokens(sqlparse.parse(query)[0])
+
+def test_binary_minus_keeps_its_operator():
+    assert _tokens("SELECT a-5 FROM t") == ["SELECT", "a", "-", "?", "FROM", "t"]
+    assert _tokens("SELECT a - 5 FROM t") == _tokens("SELECT a-5 FROM t")
+    assert _tokens("SELECT (a)-5, 2-1 FROM t") == _tokens("SELECT (a) - 5, 2 - 1 FROM t")
+    assert _tokens("SELECT a FROM t WHERE b-1>0") == ["SELECT", "a", "FROM", "t", "WHERE", "b", "-", "?", ">", "?"]
+    assert get_query_group("SELECT a-5 FROM t") != get_query_group("SELECT a 5 FROM t")
+
+def test_unary_sign_folds_into_the_literal():
+    assert _tokens("SELECT -5") == ["SELECT", "?"]
+    for query in ("SELECT * FROM t WHERE a = -5", "SELECT * FROM t WHERE a = - 5",
+                  "SELECT * FROM t WHERE a = +5", "select * from T where A=-5.5"):
+        assert _tokens(query) == _tokens("SELECT * FROM t WHERE a = 5"), query
+    assert _tokens("SELECT x FROM t WHERE a IN (1, -2, - 3) LIMIT -1") == _tokens(
+        "SELECT x FROM t WHERE a IN (1, 2, 3) LIMIT 1"
+    )
@@ -0,0 +1,131 @@
+from sqlalchemy import create_engine, insert, select
+from scorer.performance_metrics import (
+    Base, QueryText, QuerySample, QueryFingerprintRecord, QueryFingerprintBand, QueryGroupStats,
+    HistoryMetadata, GROUP_KEY_MARKER, CPU_UNIT_MARKER, ALL_TIME_START, prepare_history_engine,
+    migrate_group_keys, migrate_cpu_seconds, fingerprint_rows, text_hash,
+)
+from scorer.query_matcher import get_query_group
+from scorer.sketch import QuantileSketch
+
+# Two legacy groups the digest key puts together, sharing one text
+USERS_A = "select * from users where id = ?|SELECT|FROM|WHERE"
+USERS_B = "select * from users where id=?|SELECT|FROM|WHERE"
+USERS_TEXT = "SELECT * FROM users WHERE id = 1"
+USERS_OTHER_TEXT = "select * from USERS where id = 2"
+# A legacy group with a fingerprint but no texts left
+ORDERS = "select count(*) from orders|SELECT|FROM"
+ORDERS_NORMALIZED = "select count(*) from orders"
+# A legacy group with rollups only
+PRODUCTS = "select name from products where price > ?|SELECT|FROM|WHERE"
+
+def _sketch(values):
+    sketch = QuantileSketch()
+    sketch.add_all(values)
+    return sketch.to_json()
+
+def _stats(query_hash, values):
+    return {
+        "query_hash": query_hash, "window": "all", "window_start": ALL_TIME_START,
+        "count": len(values), "execution_time": _sketch(values), "cpu_usage": _sketch(values),
+    }
+
+def _legacy_history(path, cpu_seconds=False):
+    """
+    A history written before group keys were digests, and unless
+    cpu_seconds before CPU usage was stored in seconds
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    texts = [
+        (1, USERS_A, USERS_TEXT),
+        (2, USERS_B, USERS_TEXT),
+        (3, USERS_B, USERS_OTHER_TEXT),
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(QueryText), [
+            {"id": text_id, "query_hash": key, "query_text": query_text, "text_hash": text_hash(key, query_text)}
+            for text_id, key, query_text in texts
+        ])
+        conn.execute(insert(QuerySample), [
+            {"text_id": text_id, "timestamp": 0.0, "execution_time": 0.1, "cpu_usage": 1.0}
+            for text_id in (1, 2, 3)
+        ])
+        for key, normalized in ((USERS_A, "select * from users where id = ?"),
+                                (USERS_B, "select * from users where id=?"),
+                                (ORDERS, ORDERS_NORMALIZED)):
+            row, bands = fingerprint_rows(key, normalized, key.split('|')[1:])
+            conn.execute(insert(QueryFingerprintRecord), [row])
+            conn.execute(insert(QueryFingerprintBand), bands)
+        conn.execute(insert(QueryGroupStats), [
+            _stats(USERS_A, [1.0, 2.0]),
+            _stats(USERS_B, [3.0, 4.0, 5.0]),
+            _stats(PRODUCTS, [0.5]),
+        ])
+        if cpu_seconds:
+            key, value = CPU_UNIT_MARKER
+            conn.execute(insert(HistoryMetadata), [{"key": key, "value": value}])
+    return engine
+
+def test_colliding_texts_share_one_row(tmp_path):
+    engine = prepare_history_engine(_legacy_history(tmp_path / "history.db"))
+    users = get_query_group(USERS_TEXT)
+    assert get_query_group(USERS_OTHER_TEXT) == users
+
+    with engine.connect() as conn:
+        texts = conn.execute(select(QueryText.id, QueryText.query_hash, QueryText.query_text)).all()
+        samples = conn.execute(select(QuerySample.text_id)).scalars().all()
+    assert sorted(texts) == [(1, users, USERS_TEXT), (3, users, USERS_OTHER_TEXT)]
+    # The duplicate text's samples moved to the surviving row
+    assert sorted(samples) == [1, 1, 3]
+
+def test_pruned_groups_are_rekeyed_from_what_is_left(tmp_path):
+    engine = prepare_history_engine(_legacy_history(tmp_path / "history.db"))
+    users = get_query_group(USERS_TEXT)
+    orders = get_query_group(ORDERS_NORMALIZED)
+    products = get_query_group(PRODUCTS.split('|')[0])
+
+    with engine.connect() as conn:
+        fingerprints = conn.execute(select(QueryFingerprintRecord.query_hash)).scalars().all()
+        band_groups = set(conn.execute(select(QueryFingerprintBand.query_hash)).scalars())
+        stats_groups = set(conn.execute(select(QueryGroupStats.query_hash)).scalars())
+    assert sorted(fingerprints) == sorted([users, orders])
+    assert band_groups == {users, orders}
+    assert stats_groups == {users, products}
+
+def test_merged_groups_merge_their_sketches(tmp_path):
+    engine = prepare_history_engine(_legacy_history(tmp_path / "history.db", cpu_seconds=True))
+    with engine.connect() as conn:
+        stats = conn.execute(
+            select(QueryGroupStats).where(QueryGroupStats.query_hash == get_query_group(USERS_TEXT))
+        ).one()
+    assert stats.count == 5
+    execution_time = QuantileSketch.from_json(stats.execution_time)
+    assert execution_time.count == 5
+    assert abs(execution_time.quantile(0.0) - 1.0) < 0.02
+    assert abs(execution_time.quantile(1.0) - 5.0) < 0.1
+    assert QuantileSketch.from_json(stats.cpu_usage).count == 5
+
+def test_migration_runs_once(tmp_path):
+    engine = prepare_history_engine(_legacy_history(tmp_path / "history.db"))
+    key, value = GROUP_KEY_MARKER
+    with engine.connect() as conn:
+        assert conn.execute(select(HistoryMetadata.value).where(HistoryMetadata.key == key)).scalar() == value
+    assert migrate_group_keys(engine) == 0
+
+def test_cpu_percents_become_seconds(tmp_path):
+    engine = prepare_history_engine(_legacy_history(tmp_path / "history.db"))
+    users = get_query_group(USERS_TEXT)
+    with engine.connect() as conn:
+        # Samples were stored at 1% of 0.1s wall time
+        assert conn.execute(select(QuerySample.cpu_usage)).scalars().all() == [0.001] * 3
+        stats = conn.execute(select(QueryGroupStats).where(QueryGroupStats.query_hash == users)).one()
+        products = conn.execute(
+            select(QueryGroupStats).where(QueryGroupStats.query_hash == get_query_group(PRODUCTS.split('|')[0]))
+        ).one()
+    cpu_usage = QuantileSketch.from_json(stats.cpu_usage)
+    assert cpu_usage.count == 3
+    assert abs(cpu_usage.quantile(0.5) - 0.001) < 0.00002
+    # No samples left to convert: the rollup keeps execution times only
+    assert QuantileSketch.from_json(products.cpu_usage).count == 0
+    assert QuantileSketch.from_json(products.execution_time).count == 1
+    assert migrate_cpu_seconds(engine) == 0